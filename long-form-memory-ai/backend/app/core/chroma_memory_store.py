@@ -1,12 +1,51 @@
+import asyncio
+import heapq
+import logging
+import time
 import uuid
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import chromadb
+import xxhash
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
 from app.config import settings as app_settings
+from app.core.embeddings import get_embedder, encode_texts, cached_embed
+
+logger = logging.getLogger(__name__)
+
+# Collection used before the inner-product/xxhash-ID layout; migrated on first start
+_LEGACY_COLLECTION = "user_memories"
+_MIGRATION_PAGE_SIZE = 1000
+
+# (memory_type, key, value) of a memory item, used to build embedding texts
+_embedding_fields = itemgetter("memory_type", "key", "value")
+
+
+@lru_cache(maxsize=None)
+def get_chroma_client(persist_directory: str):
+    """Return a shared ChromaDB client for the given persist directory."""
+    return chromadb.Client(Settings(
+        persist_directory=persist_directory,
+        anonymized_telemetry=False
+    ))
+
+
+# [last refresh time, cached ISO string] for _now_iso
+_ts_cache = [0.0, ""]
+
+
+def _now_iso() -> str:
+    """Current UTC time as an ISO string, refreshed at most once per second."""
+    t = time.time()
+    if t - _ts_cache[0] >= 1.0:
+        _ts_cache[0] = t
+        _ts_cache[1] = datetime.utcfromtimestamp(t).isoformat()
+    return _ts_cache[1]
 
 
 class ChromaMemoryStore:
@@ -17,32 +56,115 @@ class ChromaMemoryStore:
     
     def __init__(self, persist_directory: str = "./chroma_db"):
         """Initialize ChromaDB client and embedding model."""
-        self.embedder = SentenceTransformer(app_settings.EMBEDDING_MODEL)
+        self.embedder = get_embedder()
         
-        # Initialize ChromaDB with persistence
-        self.client = chromadb.Client(Settings(
-            persist_directory=persist_directory,
-            anonymized_telemetry=False
-        ))
+        # Initialize ChromaDB with persistence (shared per directory)
+        self.client = get_chroma_client(persist_directory)
         
         # Create or get collections per user (we'll use one collection with user_id metadata)
-        self.collection_name = "user_memories"
+        # Embeddings are unit-norm, so inner product equals cosine similarity
+        # without HNSW normalizing on every comparison. The space of an
+        # existing collection can't change, hence the separate collection name;
+        # memories in the legacy collection are copied over on first start
+        # (see _migrate_legacy_collection) rather than left behind.
+        self.collection_name = "user_memories_ip"
+        if app_settings.EMBEDDING_BACKEND == "model2vec":
+            # Static embeddings live in a different vector space (and dimension)
+            self.collection_name += "_m2v"
         self.collection = self.client.get_or_create_collection(
             name=self.collection_name,
-            metadata={"hnsw:space": "cosine"}  # Use cosine similarity
+            metadata={"hnsw:space": "ip"}
         )
+        if self.collection.count() == 0:
+            self._migrate_legacy_collection()
+        
+        # Known memory IDs and their last written metadata, so writes can
+        # skip the existence lookup for memories this process already stored
+        self._known_ids: set[str] = set()
+        self._last_meta: dict[str, dict] = {}
+        
+        # Buffered access counters, flushed to ChromaDB in bulk
+        self._access_buf: Counter = Counter()
+        self._last_access_ts: dict[str, str] = {}
+        self._flush_interval = 5.0  # seconds
+        self._flush_threshold = 100  # buffered memories before an early flush
+        self._flush_task: Optional[asyncio.Task] = None
+        self._early_flushes: set[asyncio.Task] = set()  # Threshold flushes, referenced until done
+        
+        # Per-user memory stats, recomputed only after that user's memories change
+        self._stats_cache: dict[str, Dict[str, Any]] = {}
+        self._stats_dirty: set[str] = set()
     
-    def _generate_memory_id(self, user_id: str, memory_type: str, key: str) -> str:
+    def _generate_memory_id(self, user_id: str, memory_type: str, key: str, wide: bool = False) -> str:
         """
         Generate a consistent ID for a memory based on user_id, type, and key.
         This allows us to update/replace existing memories with the same key.
+        IDs are fixed-width xxhash digests; the raw components are kept in metadata.
+        `wide` switches to a 128-bit digest, used only when the 64-bit one collides.
+        """
+        raw = b"\x1f".join([user_id.encode(), memory_type.encode(), key.encode()])
+        if wide:
+            return xxhash.xxh128(raw).hexdigest()
+        return xxhash.xxh64(raw).hexdigest()
+    
+    def _migrate_legacy_collection(self):
         """
-        return f"{user_id}_{memory_type}_{key}".replace(" ", "_")
+        Copy memories from the legacy cosine collection, whose IDs were the raw
+        "{user}_{type}_{key}" strings, into this collection: re-embedded with
+        the current backend and re-keyed with _generate_memory_id. The legacy
+        collection is left in place untouched.
+        """
+        try:
+            legacy = self.client.get_collection(_LEGACY_COLLECTION)
+        except Exception:
+            return  # Nothing stored before the new layout
+        total = legacy.count()
+        if not total:
+            return
+        
+        logger.info("Migrating %d memories from %s to %s", total, _LEGACY_COLLECTION, self.collection_name)
+        owners: dict[str, tuple] = {}  # new id -> (user_id, memory_type, key), to detect 64-bit collisions
+        for offset in range(0, total, _MIGRATION_PAGE_SIZE):
+            page = legacy.get(
+                limit=_MIGRATION_PAGE_SIZE,
+                offset=offset,
+                include=["metadatas", "documents"]
+            )
+            ids, metadatas, documents = [], [], []
+            for metadata, document in zip(page["metadatas"], page["documents"]):
+                if not metadata or not all(metadata.get(f) is not None for f in ("user_id", "memory_type", "key")):
+                    continue
+                owner = (str(metadata["user_id"]), str(metadata["memory_type"]), str(metadata["key"]))
+                memory_id = self._generate_memory_id(*owner)
+                if owners.setdefault(memory_id, owner) != owner:
+                    memory_id = self._generate_memory_id(*owner, wide=True)
+                ids.append(memory_id)
+                metadatas.append(metadata)
+                documents.append(document or f"{owner[1]}: {owner[2]} - {metadata.get('value', '')}")
+            if ids:
+                self.collection.upsert(
+                    ids=ids,
+                    embeddings=self._get_embeddings(documents).tolist(),
+                    metadatas=metadatas,
+                    documents=documents
+                )
+        logger.info("Migrated %s into %s", _LEGACY_COLLECTION, self.collection_name)
+    
+    def _is_same_memory(self, metadata: Dict[str, Any], item: Dict[str, Any]) -> bool:
+        """Check that stored metadata belongs to the same (user_id, type, key) as item."""
+        return (
+            metadata.get("user_id") == item["user_id"]
+            and metadata.get("memory_type") == item["memory_type"]
+            and metadata.get("key") == item["key"]
+        )
+    
+    def _get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for a batch of texts in a single encode call."""
+        return encode_texts(texts)
     
     def _get_embedding(self, text: str) -> List[float]:
-        """Generate embedding for text."""
-        embedding = self.embedder.encode(text, convert_to_numpy=True)
-        return embedding.tolist()
+        """Generate embedding for text (cached for repeated queries)."""
+        return list(cached_embed(text))
     
     async def store_memory(
         self,
@@ -61,66 +183,120 @@ class ChromaMemoryStore:
         Store a new memory or UPDATE an existing one if the same key exists.
         This handles preference changes like "Spanish" -> "English".
         """
-        
-        # Generate consistent memory ID for deduplication
-        memory_id = self._generate_memory_id(user_id, memory_type, key)
-        
-        # Create embedding text
-        embedding_text = f"{memory_type}: {key} - {value}"
-        embedding = self._get_embedding(embedding_text)
-        
-        # Check if memory with same key already exists
-        try:
-            existing = self.collection.get(
-                ids=[memory_id],
-                include=["metadatas"]
-            )
-            
-            if existing and existing['ids']:
-                print(f"\n🔄 UPDATING EXISTING MEMORY: {memory_id}")
-                print(f"   Old value: {existing['metadatas'][0].get('value')}")
-                print(f"   New value: {value}")
-                
-                # Mark old memory as superseded by updating metadata
-                old_metadata = existing['metadatas'][0]
-                old_metadata['superseded_by'] = memory_id
-                old_metadata['superseded_at'] = datetime.utcnow().isoformat()
-                old_metadata['is_active'] = False
-        except Exception as e:
-            print(f"No existing memory found for {memory_id}: {e}")
-        
-        # Store/Update the memory in ChromaDB
-        metadata = {
+        stored = await self.store_memories_bulk([{
             "user_id": user_id,
             "memory_type": memory_type,
             "key": key,
             "value": value,
-            "context": context,
             "conversation_id": conversation_id,
             "turn_number": turn_number,
             "confidence": confidence,
             "importance": importance,
-            "created_at": datetime.utcnow().isoformat(),
-            "is_active": True,
-            "db_memory_id": db_memory_id or str(uuid.uuid4()),
-            "access_count": 0
+            "context": context,
+            "db_memory_id": db_memory_id
+        }])
+        return stored[0]
+    
+    async def store_memories_bulk(self, items: List[Dict]) -> List[Dict[str, Any]]:
+        """
+        Store or update several memories at once.
+        Embeddings are computed in one batch and written with a single upsert.
+        Each item takes the same fields as store_memory's arguments.
+        """
+        if not items:
+            return []
+        
+        # Generate consistent memory IDs for deduplication
+        ids = [
+            self._generate_memory_id(item["user_id"], item["memory_type"], item["key"])
+            for item in items
+        ]
+        
+        # Create embedding texts and embed them in one pass
+        documents = [
+            f"{memory_type}: {key} - {value}"
+            for memory_type, key, value in map(_embedding_fields, items)
+        ]
+        embeddings = self._get_embeddings(documents)
+        
+        # Check which memories with the same key already exist.
+        # Only IDs this process hasn't seen yet need a ChromaDB lookup.
+        existing_meta = {
+            memory_id: self._last_meta[memory_id]
+            for memory_id in ids
+            if memory_id in self._known_ids
         }
+        unknown_ids = [memory_id for memory_id in ids if memory_id not in self._known_ids]
+        if unknown_ids:
+            try:
+                existing = self.collection.get(
+                    ids=unknown_ids,
+                    include=["metadatas"]
+                )
+                
+                if existing and existing['ids']:
+                    existing_meta.update(zip(existing['ids'], existing['metadatas']))
+            except Exception as e:
+                logger.debug("No existing memories found for %s: %s", unknown_ids, e)
+        
+        for i, item in enumerate(items):
+            memory_id = ids[i]
+            old_metadata = existing_meta.get(memory_id)
+            if old_metadata is not None and not self._is_same_memory(old_metadata, item):
+                # Hash collision with a different memory: fall back to the wide ID
+                logger.warning("Memory ID collision on %s, using 128-bit ID", memory_id)
+                ids[i] = self._generate_memory_id(
+                    item["user_id"], item["memory_type"], item["key"], wide=True
+                )
+            elif old_metadata is not None and logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "UPDATING EXISTING MEMORY: %s\n   Old value: %s\n   New value: %s",
+                    memory_id, old_metadata.get('value'), item['value']
+                )
+        
+        # Store/Update the memories in ChromaDB
+        created_at = _now_iso()
+        metadatas = [
+            {
+                "user_id": item["user_id"],
+                "memory_type": item["memory_type"],
+                "key": item["key"],
+                "value": item["value"],
+                "context": item.get("context", ""),
+                "conversation_id": item["conversation_id"],
+                "turn_number": item["turn_number"],
+                "confidence": item.get("confidence", 0.5),
+                "importance": item.get("importance", 0.5),
+                "created_at": created_at,
+                "is_active": True,
+                "db_memory_id": item.get("db_memory_id") or str(uuid.uuid4()),
+                "access_count": 0
+            }
+            for item in items
+        ]
         
         # Upsert (insert or update)
         self.collection.upsert(
-            ids=[memory_id],
-            embeddings=[embedding],
-            metadatas=[metadata],
-            documents=[embedding_text]
+            ids=ids,
+            embeddings=embeddings.tolist(),
+            metadatas=metadatas,
+            documents=documents
         )
         
-        print(f"✅ Stored memory in ChromaDB: {memory_id}")
+        self._known_ids.update(ids)
+        self._last_meta.update(zip(ids, metadatas))
+        self._stats_dirty.update(metadata["user_id"] for metadata in metadatas)
         
-        return {
-            "chroma_id": memory_id,
-            "db_memory_id": metadata["db_memory_id"],
-            "metadata": metadata
-        }
+        logger.debug("Stored %d memory(ies) in ChromaDB", len(ids))
+        
+        return [
+            {
+                "chroma_id": memory_id,
+                "db_memory_id": metadata["db_memory_id"],
+                "metadata": metadata
+            }
+            for memory_id, metadata in zip(ids, metadatas)
+        ]
     
     def retrieve_relevant_memories(
         self,
@@ -139,90 +315,94 @@ class ChromaMemoryStore:
         # Generate query embedding
         query_embedding = self._get_embedding(query)
         
-        # Query ChromaDB
+        # Only active memories of this user (and of the requested types)
+        conditions = [{"user_id": user_id}, {"is_active": True}]
+        if memory_types:
+            conditions.append({"memory_type": {"$in": list(memory_types)}})
+        
+        # Query ChromaDB; type filtering happens server-side. Over-fetch
+        # candidates either way so the recency/importance re-rank has headroom
         results = self.collection.query(
             query_embeddings=[query_embedding],
-            n_results=min(top_k * 3, 100),  # Get more results for filtering
-            where={
-                "user_id": user_id,
-                "is_active": True  # Only active memories
-            },
+            n_results=min(top_k * 3, 100),
+            where={"$and": conditions},
             include=["metadatas", "documents", "distances"]
         )
         
         if not results or not results['ids'] or not results['ids'][0]:
             return []
         
-        memories = []
+        ids = results['ids'][0]
+        metas = results['metadatas'][0]
+        documents = results['documents'][0]
         
-        for i, mem_id in enumerate(results['ids'][0]):
-            metadata = results['metadatas'][0][i]
-            document = results['documents'][0][i]
-            distance = results['distances'][0][i]
-            
-            # Filter by memory type if specified
-            if memory_types and metadata['memory_type'] not in memory_types:
-                continue
-            
-            # Calculate similarity score (ChromaDB returns distance, lower is better)
-            # For cosine distance: similarity = 1 - distance
-            similarity = 1 - distance
-            
-            # Calculate recency boost
-            turn_diff = current_turn - metadata.get('turn_number', 0)
-            recency_boost = 0.2 * np.exp(-turn_diff / 50.0)  # Decay over 50 turns
-            
-            # Calculate importance boost
-            importance_boost = metadata.get('importance', 0.5) * 0.15
-            
-            # Final score = similarity + recency + importance
-            final_score = similarity + recency_boost + importance_boost
-            
+        # Score every candidate in one vectorized pass
+        # For inner product distance on unit vectors: similarity = 1 - distance
+        similarity = 1.0 - np.asarray(results['distances'][0], dtype=np.float32)
+        turns = np.fromiter((m.get('turn_number', 0) for m in metas), dtype=np.int32, count=len(metas))
+        imps = np.fromiter((m.get('importance', 0.5) for m in metas), dtype=np.float32, count=len(metas))
+        
+        recency_boost = 0.2 * np.exp(-(current_turn - turns) / 50.0)  # Decay over 50 turns
+        importance_boost = imps * 0.15
+        final = similarity + recency_boost + importance_boost
+        
+        k = min(top_k, len(ids))
+        
+        # Select the top_k in O(n), then sort only those by final score (descending)
+        if k < len(final):
+            order = np.argpartition(-final, k - 1)[:k]
+        else:
+            order = np.arange(len(final))
+        order = order[np.argsort(-final[order])]
+        
+        memories = []
+        for i in order:
+            metadata = metas[i]
             memories.append({
-                'chroma_id': mem_id,
+                'chroma_id': ids[i],
                 'db_memory_id': metadata.get('db_memory_id'),
                 'memory_type': metadata['memory_type'],
                 'key': metadata['key'],
                 'value': metadata['value'],
                 'context': metadata.get('context', '') if include_context else '',
-                'document': document,
-                'similarity': similarity,
-                'recency_boost': recency_boost,
-                'importance_boost': importance_boost,
-                'final_score': final_score,
+                'document': documents[i],
+                'similarity': float(similarity[i]),
+                'recency_boost': float(recency_boost[i]),
+                'importance_boost': float(importance_boost[i]),
+                'final_score': float(final[i]),
                 'turn_number': metadata.get('turn_number', 0),
                 'confidence': metadata.get('confidence', 0.5),
                 'importance': metadata.get('importance', 0.5),
                 'created_at': metadata.get('created_at')
             })
         
-        # Sort by final score (descending)
-        memories.sort(key=lambda x: x['final_score'], reverse=True)
-        
-        # Return top_k
-        return memories[:top_k]
+        return memories
     
     def get_all_active_memories(
         self,
         user_id: str,
         memory_type: Optional[str] = None,
-        sort_by: str = "importance"  # "importance", "recency", or "relevance"
+        sort_by: str = "importance",  # "importance", "recency", or "relevance"
+        limit: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
         Get all active memories for a user, sorted by specified criterion.
+        With `limit`, only the top `limit` memories are returned.
         """
         
-        where_filter = {
-            "user_id": user_id,
-            "is_active": True
-        }
+        conditions = [{"user_id": user_id}, {"is_active": True}]
         
         if memory_type:
-            where_filter["memory_type"] = memory_type
+            conditions.append({"memory_type": memory_type})
+        
+        where_filter = {"$and": conditions}
         
         try:
+            sorted_fetch = sort_by in ("importance", "recency")
             results = self.collection.get(
                 where=where_filter,
+                # Unsorted requests can stop reading after `limit` rows
+                limit=None if sorted_fetch else limit,
                 include=["metadatas", "documents"]
             )
             
@@ -245,16 +425,18 @@ class ChromaMemoryStore:
                     'created_at': metadata.get('created_at')
                 })
             
-            # Sort based on criterion
-            if sort_by == "importance":
-                memories.sort(key=lambda x: x['importance'], reverse=True)
-            elif sort_by == "recency":
-                memories.sort(key=lambda x: x['turn_number'], reverse=True)
+            # Sort based on criterion; a partial heap select is enough for top-N
+            if sorted_fetch:
+                sort_field = 'importance' if sort_by == "importance" else 'turn_number'
+                if limit:
+                    memories = heapq.nlargest(limit, memories, key=itemgetter(sort_field))
+                else:
+                    memories.sort(key=itemgetter(sort_field), reverse=True)
             
             return memories
             
         except Exception as e:
-            print(f"Error retrieving memories: {e}")
+            logger.error("Error retrieving memories: %s", e)
             return []
     
     def deactivate_memory(self, chroma_id: str) -> bool:
@@ -274,7 +456,9 @@ class ChromaMemoryStore:
             # Update metadata to mark as inactive
             metadata = existing['metadatas'][0]
             metadata['is_active'] = False
-            metadata['deactivated_at'] = datetime.utcnow().isoformat()
+            metadata['deactivated_at'] = _now_iso()
+            if metadata.get('user_id'):
+                self._stats_dirty.add(metadata['user_id'])
             
             # Update in ChromaDB
             self.collection.update(
@@ -282,44 +466,105 @@ class ChromaMemoryStore:
                 metadatas=[metadata]
             )
             
+            if chroma_id in self._known_ids:
+                self._last_meta[chroma_id] = metadata
+            
             return True
             
         except Exception as e:
-            print(f"Error deactivating memory: {e}")
+            logger.error("Error deactivating memory: %s", e)
             return False
     
     def update_memory_access(self, chroma_id: str) -> bool:
         """
-        Update access count for a memory when it's used.
+        Record an access for a memory when it's used.
+        Counts are buffered in memory and written by flush_access_counters.
         """
+        self._access_buf[chroma_id] += 1
+        self._last_access_ts[chroma_id] = _now_iso()
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (e.g. scripts): callers flush explicitly
+            return True
+        
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._periodic_flush())
+        if len(self._access_buf) >= self._flush_threshold:
+            task = loop.create_task(self.flush_access_counters())
+            self._early_flushes.add(task)
+            task.add_done_callback(self._early_flushes.discard)
+        
+        return True
+    
+    async def close(self):
+        """
+        Stop the periodic flush and write whatever access counts are still
+        buffered. Call on shutdown, or the buffered counts are lost.
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if self._early_flushes:
+            await asyncio.gather(*self._early_flushes, return_exceptions=True)
+        await self.flush_access_counters()
+    
+    async def _periodic_flush(self):
+        """Flush buffered access counters every few seconds."""
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush_access_counters()
+    
+    async def flush_access_counters(self) -> int:
+        """
+        Write all buffered access counts with one get and one update call.
+        Returns the number of memories updated.
+        """
+        if not self._access_buf:
+            return 0
+        
+        counts, self._access_buf = self._access_buf, Counter()
+        timestamps, self._last_access_ts = self._last_access_ts, {}
+        
         try:
             existing = self.collection.get(
-                ids=[chroma_id],
+                ids=list(counts),
                 include=["metadatas"]
             )
             
             if not existing or not existing['ids']:
-                return False
+                return 0
             
-            metadata = existing['metadatas'][0]
-            metadata['access_count'] = metadata.get('access_count', 0) + 1
-            metadata['last_accessed_at'] = datetime.utcnow().isoformat()
+            for chroma_id, metadata in zip(existing['ids'], existing['metadatas']):
+                metadata['access_count'] = metadata.get('access_count', 0) + counts[chroma_id]
+                metadata['last_accessed_at'] = timestamps[chroma_id]
+                if chroma_id in self._known_ids:
+                    self._last_meta[chroma_id] = metadata
             
             self.collection.update(
-                ids=[chroma_id],
-                metadatas=[metadata]
+                ids=existing['ids'],
+                metadatas=existing['metadatas']
             )
             
-            return True
+            return len(existing['ids'])
             
         except Exception as e:
-            print(f"Error updating memory access: {e}")
-            return False
+            logger.error("Error updating memory access: %s", e)
+            return 0
     
     def get_memory_stats(self, user_id: str) -> Dict[str, Any]:
         """
         Get statistics about user's memories.
+        Cached per user until a store or deactivation touches that user.
         """
+        if user_id not in self._stats_dirty and user_id in self._stats_cache:
+            return self._stats_cache[user_id]
+        
         memories = self.get_all_active_memories(user_id)
         
         stats = {
@@ -336,4 +581,6 @@ class ChromaMemoryStore:
             if mem['importance'] >= 0.8:
                 stats["high_importance_count"] += 1
         
+        self._stats_cache[user_id] = stats
+        self._stats_dirty.discard(user_id)
         return stats
@@ -0,0 +1,49 @@
+import logging
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from app.config import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_embedder():
+    """
+    Load the embedding model once per process.
+    EMBEDDING_BACKEND="model2vec" swaps the transformer for a static-embedding
+    model (table lookup + mean pool), which is much faster on CPU.
+    """
+    if app_settings.EMBEDDING_BACKEND == "model2vec":
+        from model2vec import StaticModel
+        return StaticModel.from_pretrained(app_settings.STATIC_EMBEDDING_MODEL)
+    model = SentenceTransformer(app_settings.EMBEDDING_MODEL)
+    # Batched encodes rely on the Rust-backed fast tokenizer
+    if not getattr(model.tokenizer, "is_fast", False):
+        logger.warning("Embedding model %s has no fast tokenizer", app_settings.EMBEDDING_MODEL)
+    return model
+
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """Encode texts with the shared embedder into unit-norm float32 vectors."""
+    embedder = get_embedder()
+    if app_settings.EMBEDDING_BACKEND == "model2vec":
+        embeddings = np.asarray(embedder.encode(texts, batch_size=64), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+    return embedder.encode(
+        texts,
+        batch_size=64,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+        normalize_embeddings=True
+    )
+
+
+@lru_cache(maxsize=4096)
+def cached_embed(text: str) -> tuple:
+    """Embed a single text with the shared model, memoizing repeated texts."""
+    return tuple(encode_texts([text])[0].tolist())
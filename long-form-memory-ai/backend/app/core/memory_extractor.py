@@ -1,21 +1,86 @@
+import asyncio
 import json
+import logging
 import re
+import orjson
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+from functools import lru_cache
+import httpx
 from openai import AsyncOpenAI
-from app.config import settings
+from app.config import settings, LLM_MODEL
 
-client = AsyncOpenAI(
-    api_key=settings.OPENROUTER_API_KEY,
-    base_url=settings.OPENROUTER_BASE_URL,
-)
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=1)
+def get_llm_client() -> AsyncOpenAI:
+    """
+    Create the extraction LLM client on first use and reuse it afterwards.
+    HTTP/2 with a keepalive pool lets concurrent extractions share connections.
+    """
+    return AsyncOpenAI(
+        api_key=settings.OPENROUTER_API_KEY,
+        base_url=settings.OPENROUTER_BASE_URL,
+        # The SDK default (600 s, two retries) would let one stuck call hold an extraction slot
+        timeout=settings.EXTRACTION_TIMEOUT_SECONDS,
+        max_retries=1,
+        http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32)
+        ),
+    )
+
+# Expanded signal list for better memory capture
+_MEMORY_SIGNALS = [
+    # Personal identity
+    "my name", "i am", "i'm", "call me", "you can call me",
+    # Location and background  
+    "i go to", "i study", "i work", "i live", "i am from", "i was born",
+    # Preferences (expanded)
+    "my favorite", "i like", "i love", "i hate", "i prefer", "i enjoy",
+    "i don't like", "i dislike", "i'm not a fan", "not my favorite",
+    # Demographics
+    "language", "speak", "remember", "my birthday", "my age", "years old",
+    # Lifestyle and habits
+    "i usually", "i always", "i never", "i often", "i sometimes",
+    "my routine", "my schedule", "i wake up", "i go to bed",
+    # Relationships and social
+    "my friend", "my family", "my brother", "my sister", "my parents",
+    "my partner", "my boyfriend", "my girlfriend",
+    # Interests and hobbies
+    "i play", "i watch", "i read", "i listen", "collect", "hobby",
+    "i'm interested in", "passion", "my hobby",
+    # Food and dietary
+    "i eat", "i cook", "vegetarian", "vegan", "diet", "allergic",
+    # Long-term goals
+    "my goal", "i want to become", "i want to achieve", "long term"
+]
+
+# All signals compiled into one case-insensitive alternation, so a message is
+# scanned once instead of once per signal
+_SIGNAL_RE = re.compile("|".join(map(re.escape, _MEMORY_SIGNALS)), re.IGNORECASE)
+
+
+def _parse_json_response(content: str) -> Any:
+    """Strip an optional Markdown code fence from an LLM reply and parse it as JSON."""
+    s = content.strip()
+    if s.startswith("```json"):
+        s = s[7:]
+    elif s.startswith("```"):
+        s = s[3:]
+    if s.endswith("```"):
+        s = s[:-3]
+    try:
+        return orjson.loads(s)
+    except orjson.JSONDecodeError:
+        return json.loads(s)
 
 
 class MemoryExtractor:
     """Extracts structured memories from conversation turns using LLM."""
     
     def __init__(self):
-        self.extraction_prompt = """You are a long-term memory extraction system. Extract only durable personal information that is likely to remain useful across future conversations.
+        self.extraction_rules = """You are a long-term memory extraction system. Extract only durable personal information that is likely to remain useful across future conversations.
 
 Keep only stable and user-centric memories, such as:
 - identity/background (name, work, studies, city, relationships)
@@ -63,7 +128,9 @@ For each memory found, provide:
 - key: Specific, semantic identifier (e.g., "favorite_movie_genre", "sister_name")
 - value: The exact information to remember (include numbers, names, specifics)
 - confidence: 0.0 to 1.0 score (how certain you are this is correct)
-- importance: 0.0 to 1.0 score (how critical this is for future conversations)
+- importance: 0.0 to 1.0 score (how critical this is for future conversations)"""
+
+        self.extraction_prompt = self.extraction_rules + """
 
 Conversation:
 {conversation}
@@ -86,6 +153,162 @@ Example:
     "importance": 0.6
   }}
 ]"""
+
+        self.batch_extraction_prompt = self.extraction_rules + """
+
+The conversations below are independent turns, each labeled with a turn id.
+Extract memories for each turn separately.
+
+{conversations}
+
+Respond ONLY with a JSON object mapping each turn id to its JSON array of memories.
+Use an empty array [] for turns with no memories.
+Example:
+{{
+  "T1": [
+    {{
+      "type": "preference",
+      "key": "language_preference",
+      "value": "Kannada",
+      "confidence": 0.95,
+      "importance": 0.8
+    }}
+  ],
+  "T2": []
+}}"""
+
+        # Background extraction queue, started lazily on first enqueue
+        self._extraction_queue: Optional[asyncio.Queue] = None
+        self._extraction_worker_task: Optional[asyncio.Task] = None
+        self._extraction_slots: Optional[asyncio.Semaphore] = None
+        self._extraction_tasks: set = set()  # Batches in flight, referenced until done
+        self._max_batch_size = 8
+    
+    def enqueue_extraction(
+        self,
+        user_id: str,
+        user_message: str,
+        assistant_response: str,
+        turn_number: int,
+        conversation_history: Optional[List[Dict]] = None,
+        extraction_boost: float = 0.0
+    ) -> "asyncio.Future[List[Dict[str, Any]]]":
+        """
+        Queue a turn for background extraction and return immediately.
+        The returned future resolves to the same list extract_memories would return,
+        or raises if the batch's LLM call failed or the queue is full.
+        Turns of the same user queued close together are extracted with a single
+        LLM call; turns of different users never share a prompt.
+        """
+        loop = asyncio.get_running_loop()
+        if self._extraction_queue is None:
+            self._extraction_queue = asyncio.Queue(maxsize=settings.EXTRACTION_QUEUE_SIZE)
+            self._extraction_slots = asyncio.Semaphore(settings.EXTRACTION_CONCURRENCY)
+        if self._extraction_worker_task is None or self._extraction_worker_task.done():
+            self._extraction_worker_task = loop.create_task(self._extraction_worker())
+        
+        future = loop.create_future()
+        try:
+            self._extraction_queue.put_nowait({
+                "user_id": user_id,
+                "user_message": user_message,
+                "assistant_response": assistant_response,
+                "turn_number": turn_number,
+                "conversation_history": conversation_history,
+                "extraction_boost": extraction_boost,
+                "future": future
+            })
+        except asyncio.QueueFull:
+            logger.warning("Extraction queue full; dropping turn %s", turn_number)
+            future.set_exception(RuntimeError("memory extraction queue is full"))
+        return future
+    
+    async def _extraction_worker(self):
+        """
+        Drain the extraction queue, batching a user's pending turns into one LLM
+        call. Batches run as tasks, at most EXTRACTION_CONCURRENCY at a time;
+        while every slot is busy the worker stops draining, so turns pile up in
+        the bounded queue and get merged into larger batches.
+        """
+        queue = self._extraction_queue
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty() and len(batch) < self._max_batch_size:
+                batch.append(queue.get_nowait())
+            
+            # One prompt per user, so no user's conversation or memories reach another's
+            by_user: Dict[str, List[Dict[str, Any]]] = {}
+            for job in batch:
+                by_user.setdefault(job["user_id"], []).append(job)
+            for jobs in by_user.values():
+                await self._extraction_slots.acquire()
+                task = asyncio.get_running_loop().create_task(self._run_batch(jobs))
+                self._extraction_tasks.add(task)
+                task.add_done_callback(self._extraction_done)
+    
+    def _extraction_done(self, task: asyncio.Task):
+        self._extraction_tasks.discard(task)
+        self._extraction_slots.release()
+    
+    async def _run_batch(self, batch: List[Dict[str, Any]]):
+        """Extract one user's queued turns and resolve their futures."""
+        try:
+            results = await self._extract_batch(batch)
+        except Exception as e:
+            logger.exception("Batch memory extraction failed for %d turn(s)", len(batch))
+            for job in batch:
+                if not job["future"].done():
+                    job["future"].set_exception(e)
+            return
+        
+        for job, memories in zip(batch, results):
+            if not job["future"].done():
+                job["future"].set_result(memories)
+    
+    async def _extract_batch(self, batch: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Extract memories for several queued turns of one user with a single LLM call."""
+        if len(batch) == 1:
+            job = batch[0]
+            return [await self.extract_memories(
+                user_message=job["user_message"],
+                assistant_response=job["assistant_response"],
+                turn_number=job["turn_number"],
+                conversation_history=job["conversation_history"],
+                extraction_boost=job["extraction_boost"]
+            )]
+        
+        blocks = []
+        for i, job in enumerate(batch, 1):
+            context = self._build_context(
+                job["conversation_history"], job["user_message"], job["assistant_response"]
+            )
+            blocks.append(f"TURN T{i}:\n{context}")
+        
+        response = await get_llm_client().chat.completions.create(
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": "You extract structured memories from conversations."},
+                {"role": "user", "content": self.batch_extraction_prompt.format(conversations="\n\n".join(blocks))}
+            ],
+            temperature=0.1,
+            max_tokens=1000 * len(batch)
+        )
+        
+        content = response.choices[0].message.content
+        by_turn = _parse_json_response(content)
+        if not isinstance(by_turn, dict):
+            by_turn = {}
+        
+        results = []
+        for i, job in enumerate(batch, 1):
+            memories = by_turn.get(f"T{i}") or []
+            validated = self._validate_extracted(memories, job["turn_number"], job["extraction_boost"])
+            if job["extraction_boost"] >= 1.5 and not validated:
+                validated.extend(await self._minimal_extraction(
+                    job["user_message"], job["assistant_response"], job["turn_number"], job["extraction_boost"]
+                ))
+            results.append(validated)
+        return results
     
     async def extract_memories(
         self,
@@ -101,8 +324,8 @@ Example:
         context = self._build_context(conversation_history, user_message, assistant_response)
         
         try:
-            response = await client.chat.completions.create(
-                model=settings.LLM_MODEL,
+            response = await get_llm_client().chat.completions.create(
+                model=LLM_MODEL,
                 messages=[
                     {"role": "system", "content": "You extract structured memories from conversations."},
                     {"role": "user", "content": self.extraction_prompt.format(conversation=context)}
@@ -116,31 +339,10 @@ Example:
             print(content)
             print("====================================\n")
             
-            # Clean up JSON response
-            content = re.sub(r'```json\s*', '', content)
-            content = re.sub(r'```\s*', '', content)
+            # Clean up and parse JSON response
+            memories = _parse_json_response(content)
             
-            memories = json.loads(content)
-            
-            # Validate and enrich memories
-            validated_memories = []
-            for mem in memories:
-                if self._validate_memory(mem):
-                    mem["type"] = str(mem.get("type", "")).strip().lower()
-                    mem["key"] = str(mem.get("key", "")).strip().lower().replace(" ", "_")
-                    mem["value"] = str(mem.get("value", "")).strip()
-                    mem["confidence"] = float(mem.get("confidence", 0.0))
-                    mem["importance"] = float(mem.get("importance", 0.0))
-                    mem['source_turn'] = turn_number
-                    mem['extracted_at'] = datetime.utcnow().isoformat()
-                    
-                    # Apply extraction boost to importance
-                    if extraction_boost > 0:
-                        mem['importance'] = min(1.0, mem.get('importance', 0.5) + extraction_boost)
-                        print(f"   Applied extraction boost +{extraction_boost:.1f} to [{mem['type']}] {mem['key']}")
-
-                    if self._is_useful_memory(mem):
-                        validated_memories.append(mem)
+            validated_memories = self._validate_extracted(memories, turn_number, extraction_boost)
             
             # Special handling: If extraction was forced but nothing was found, try minimal extraction
             if extraction_boost >= 1.5 and not validated_memories:
@@ -156,6 +358,33 @@ Example:
             print(f"Memory extraction error: {e}")
             return []
     
+    def _validate_extracted(
+        self,
+        memories: List[Dict],
+        turn_number: int,
+        extraction_boost: float
+    ) -> List[Dict[str, Any]]:
+        """Validate and enrich raw memories parsed from an extraction response."""
+        validated_memories = []
+        for mem in memories:
+            if self._validate_memory(mem):
+                mem["type"] = str(mem.get("type", "")).strip().lower()
+                mem["key"] = str(mem.get("key", "")).strip().lower().replace(" ", "_")
+                mem["value"] = str(mem.get("value", "")).strip()
+                mem["confidence"] = float(mem.get("confidence", 0.0))
+                mem["importance"] = float(mem.get("importance", 0.0))
+                mem['source_turn'] = turn_number
+                mem['extracted_at'] = datetime.utcnow().isoformat()
+                
+                # Apply extraction boost to importance
+                if extraction_boost > 0:
+                    mem['importance'] = min(1.0, mem.get('importance', 0.5) + extraction_boost)
+                    print(f"   Applied extraction boost +{extraction_boost:.1f} to [{mem['type']}] {mem['key']}")
+
+                if self._is_useful_memory(mem):
+                    validated_memories.append(mem)
+        return validated_memories
+    
     def _build_context(
         self,
         history: Optional[List[Dict]],
@@ -314,35 +543,7 @@ Example:
         if not user_message:
             return False
 
-        message = user_message.lower()
-        
-        # Expanded signal list for better memory capture
-        signals = [
-            # Personal identity
-            "my name", "i am", "i'm", "call me", "you can call me",
-            # Location and background  
-            "i go to", "i study", "i work", "i live", "i am from", "i was born",
-            # Preferences (expanded)
-            "my favorite", "i like", "i love", "i hate", "i prefer", "i enjoy",
-            "i don't like", "i dislike", "i'm not a fan", "not my favorite",
-            # Demographics
-            "language", "speak", "remember", "my birthday", "my age", "years old",
-            # Lifestyle and habits
-            "i usually", "i always", "i never", "i often", "i sometimes",
-            "my routine", "my schedule", "i wake up", "i go to bed",
-            # Relationships and social
-            "my friend", "my family", "my brother", "my sister", "my parents",
-            "my partner", "my boyfriend", "my girlfriend",
-            # Interests and hobbies
-            "i play", "i watch", "i read", "i listen", "collect", "hobby",
-            "i'm interested in", "passion", "my hobby",
-            # Food and dietary
-            "i eat", "i cook", "vegetarian", "vegan", "diet", "allergic",
-            # Long-term goals
-            "my goal", "i want to become", "i want to achieve", "long term"
-        ]
-
-        return any(signal in message for signal in signals)
+        return bool(_SIGNAL_RE.search(user_message))
 
     async def _minimal_extraction(
         self,
@@ -11,10 +11,91 @@ Example:
   the answer should involve Eren (or the main character concept)
 """
 
+import json
+import logging
+import re
 from typing import List, Dict, Any, Optional
+import ahocorasick
+from cachetools import LRUCache
 from app.services.llm_service import LLMService
 from app.models.memory import Memory
 
+logger = logging.getLogger(__name__)
+
+# Keywords (as regex fragments) that suggest a memory-related query
+_MEMORY_SIGNALS = [
+    "my", "i", "me", "mine",
+    "favorite", "like", "prefer", "love", "hate",
+    "name", "age", "school", "work", "job", "hobbies",
+    "character", "show", "movie", "book", "artist",
+    "what.*about.*me", "tell.*about.*me", "you.*know",
+    "do you remember", "remember me", "knowledge"
+]
+
+# Line-oriented fallback for responses that are not valid JSON
+_REASONING_FIELD_RE = re.compile(
+    r"^\s*(DIRECT_ANSWER|INFERENCE_POSSIBLE|REASONING_CHAIN|CONFIDENCE|INFERRED_ANSWER|SOURCES|EXPLANATION):\s*(.*)$",
+    re.MULTILINE
+)
+
+# Static part of the reasoning system prompt (rules, example, output schema)
+_REASONING_PROMPT_PREFIX = """You are an expert at logical reasoning over user preferences and facts.
+
+Your task is to analyze whether the user's question can be INFERRED from their stored memories, even if they haven't explicitly stated the answer.
+
+STRICT RULES:
+1. ONLY infer if there is a clear logical chain from stored facts to the question
+2. You MAY use common world knowledge to connect a stored preference to a specific instance
+3. If a memory expresses a GENERAL preference (e.g., favorite character type), apply it to general queries about favorites
+4. If the user asks about a specific series/film, map the general preference to that series using common knowledge
+5. DO NOT make assumptions or fill in gaps that aren't supported by memories or common knowledge
+6. If uncertain, explicitly say you cannot make a confident inference
+7. Be specific about WHY you can or cannot make the inference
+
+EXAMPLE:
+- Memory: preference favorite_anime_character_type = "main character"
+- Question: "Who is my favorite character in Black Clover?"
+- Inference: The user prefers main characters; the main character of Black Clover is Asta.
+
+For the memories, context and question given below, analyze:
+1. Can you find the DIRECT ANSWER in memories? (Yes/No)
+2. If not, can you INFER the answer from logical relationships between memories? (Yes/No)
+3. What is the REASONING CHAIN? (Step by step logic)
+4. What is your CONFIDENCE LEVEL? (0-1)
+5. What is the INFERRED ANSWER if applicable?
+6. Which MEMORY SOURCES support this inference?
+
+Respond with ONLY a JSON object in exactly this format:
+{
+  "direct_answer": true or false,
+  "inference_possible": true or false,
+  "reasoning_chain": "step by step explanation",
+  "confidence": 0.0-1.0,
+  "inferred_answer": "answer or N/A",
+  "sources": ["memory keys used"],
+  "explanation": "brief explanation of why or why not"
+}"""
+
+
+def _as_bool(value: Any) -> bool:
+    """Read a JSON flag that the model may emit as a bool or as "yes"/"true"."""
+    if isinstance(value, str):
+        return value.strip().lower() in ("yes", "true")
+    return bool(value)
+
+
+def _build_automaton(words: List[str]) -> Optional["ahocorasick.Automaton"]:
+    """Build an Aho-Corasick automaton mapping each word to (word, first position)."""
+    automaton = ahocorasick.Automaton()
+    for i, word in enumerate(words):
+        if word and not automaton.exists(word):
+            automaton.add_word(word, (word, i))
+    if len(automaton) == 0:
+        return None
+    automaton.make_automaton()
+    return automaton
+
+
 
 class MemoryReasoner:
     """
@@ -23,6 +104,47 @@ class MemoryReasoner:
     
     def __init__(self):
         self.llm_service = LLMService()
+        # user_id -> (memory key signature, automaton over lowercased keys)
+        self._key_automata: LRUCache = LRUCache(maxsize=1024)
+        # (user_id, normalized query, memory signature, recent context) -> inference result
+        self._inference_cache: LRUCache = LRUCache(maxsize=4096)
+        # All signals fused into one alternation, matched on word boundaries
+        self._signal_re = re.compile(r"\b(?:" + "|".join(_MEMORY_SIGNALS) + r")\b", re.IGNORECASE)
+    
+    def _get_key_automaton(self, user_id: str, memories: List[Memory]):
+        """Return the user's key automaton, rebuilding it only when memories change."""
+        keys = [str(mem.key).lower() for mem in memories]
+        signature = tuple(keys)
+        cached = self._key_automata.get(user_id)
+        if cached is None or cached[0] != signature:
+            cached = (signature, _build_automaton(keys))
+            self._key_automata[user_id] = cached
+        return cached[1]
+    
+    def _get_recent_context(self, conversation_history: List[Dict[str, str]]) -> str:
+        """Format the last three history messages for the reasoning prompt."""
+        recent_context_lines = []
+        if conversation_history:
+            for m in conversation_history[-3:]:
+                if isinstance(m, dict) and 'role' in m and 'content' in m:
+                    recent_context_lines.append(f"{m['role'].upper()}: {m['content'][:100]}")
+        return "\n".join(recent_context_lines) if recent_context_lines else "No recent context"
+    
+    def _cache_lookup(self, cache_key: tuple) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached inference for the same normalized query, over the
+        same memories and recent context, if any.
+        """
+        cached = self._inference_cache.get(cache_key)
+        if cached is None:
+            return None
+        result = dict(cached)
+        result["inference_chain"] += " (cache hit)"
+        return result
+    
+    def _cache_store(self, cache_key: tuple, result: Dict[str, Any]):
+        """Remember an inference result; the least recently used entry is evicted."""
+        self._inference_cache[cache_key] = result
     
     async def reason_over_memories(
         self,
@@ -46,12 +168,14 @@ class MemoryReasoner:
         }
         """
         
-        print("\n===== MEMORY REASONING ANALYSIS =====")
-        print(f"Query: {user_query}")
-        print(f"Available memories: {len(memories)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Memory reasoning: query=%r, available memories=%d",
+                user_query, len(memories)
+            )
         
         if not memories:
-            print("No memories available for reasoning")
+            logger.debug("No memories available for reasoning")
             return {
                 "has_direct_answer": False,
                 "has_inference": False,
@@ -63,9 +187,12 @@ class MemoryReasoner:
             }
         
         # First check if there's a direct memory match
-        direct_match = self._find_direct_match(user_query, memories)
+        direct_match = self._find_direct_match(user_query, memories, user_id)
         if direct_match:
-            print(f"Direct match found: {direct_match['memory'].key} = {direct_match['memory'].value}")
+            logger.debug(
+                "Direct match found: %s = %s",
+                direct_match['memory'].key, direct_match['memory'].value
+            )
             return {
                 "has_direct_answer": True,
                 "has_inference": False,
@@ -79,7 +206,7 @@ class MemoryReasoner:
         # Quick check: Is this query even memory-related?
         # Skip inference for general requests unrelated to the user
         if not self._is_query_memory_relevant(user_query, memories):
-            print("Query not memory-related. Skipping inference reasoning.")
+            logger.debug("Query not memory-related. Skipping inference reasoning.")
             return {
                 "has_direct_answer": False,
                 "has_inference": False,
@@ -90,30 +217,59 @@ class MemoryReasoner:
                 "should_use": False
             }
         
+        # Reuse the inference for the same question asked over the same memories and context
+        cache_key = (
+            user_id,
+            " ".join(user_query.lower().split()),
+            self._memory_signature(memories),
+            self._get_recent_context(conversation_history),
+        )
+        cached_result = self._cache_lookup(cache_key)
+        if cached_result is not None:
+            logger.debug("Inference cache hit. Skipping inference reasoning.")
+            return cached_result
+        
         # If no direct match, try inference reasoning
-        print("No direct match found. Attempting inference...")
+        logger.debug("No direct match found. Attempting inference...")
         
         inference_result = await self._perform_inference(
             user_query=user_query,
             memories=memories,
             conversation_history=conversation_history
         )
+        if not inference_result["inference_chain"].startswith("Reasoning failed"):
+            self._cache_store(cache_key, inference_result)
         
-        print(f"Inference result: confidence={inference_result['confidence']:.2f}, should_use={inference_result['should_use']}")
-        print("=====================================\n")
+        logger.debug(
+            "Inference result: confidence=%.2f, should_use=%s",
+            inference_result['confidence'], inference_result['should_use']
+        )
         
         return inference_result
     
-    def _find_direct_match(self, query: str, memories: List[Memory]) -> Optional[Dict[str, Any]]:
+    def _find_direct_match(
+        self,
+        query: str,
+        memories: List[Memory],
+        user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Check if query directly matches a stored memory.
+        Scans the query once against an automaton of all memory keys and
+        returns the longest key found.
         """
         query_lower = query.lower()
         
+        automaton = self._get_key_automaton(user_id, memories)
+        if automaton is not None:
+            best = max(automaton.iter(query_lower), key=lambda hit: len(hit[1][0]), default=None)
+            if best is not None:
+                return {"memory": memories[best[1][1]], "match_type": "key"}
+        
+        # Query contained in a (longer) key
         for mem in memories:
             key_lower = str(mem.key).lower()
-            # Direct key match
-            if key_lower in query_lower or query_lower in key_lower:
+            if len(key_lower) >= len(query_lower) and query_lower in key_lower:
                 return {"memory": mem, "match_type": "key"}
         
         return None
@@ -126,20 +282,9 @@ class MemoryReasoner:
         """
         query_lower = user_query.lower()
         
-        # Keywords that suggest a memory-related query
-        memory_signals = [
-            "my", "i", "me", "mine",
-            "favorite", "like", "prefer", "love", "hate",
-            "name", "age", "school", "work", "job", "hobbies",
-            "character", "show", "movie", "book", "artist",
-            "what.*about.*me", "tell.*about.*me", "you.*know",
-            "do you remember", "remember me", "knowledge"
-        ]
-        
         # Check if any memory signal appears in query
-        for signal in memory_signals:
-            if signal in query_lower:
-                return True
+        if self._signal_re.search(user_query):
+            return True
         
         # Also check if any memory key appears in the query
         for mem in memories[:5]:  # Check first 5 memories
@@ -171,28 +316,20 @@ class MemoryReasoner:
             conversation_history=conversation_history
         )
         
-        print(f"\nCalling LLM for inference reasoning...")
+        logger.debug("Calling LLM for inference reasoning...")
         
         try:
             # Call LLM for reasoning
-            response = self.llm_service.generate_response(
+            full_response = await self.llm_service.complete(
                 messages=[
                     {"role": "system", "content": reasoning_prompt},
                     {"role": "user", "content": user_query}
                 ],
-                stream=False,
                 max_tokens=500,
-                temperature=0.2
+                temperature=0.2,
+                response_format={"type": "json_object"}
             )
             
-            # Process the streaming response
-            full_response = ""
-            async for event in response:
-                if event["type"] == "token":
-                    full_response += event.get("content", "")
-                elif event["type"] == "final":
-                    full_response += event.get("content", "")
-            
             # Parse LLM reasoning response
             reasoning_analysis = self._parse_reasoning_response(
                 llm_response=full_response,
@@ -202,7 +339,7 @@ class MemoryReasoner:
             return reasoning_analysis
             
         except Exception as e:
-            print(f"Error during LLM inference: {e}")
+            logger.warning("Error during LLM inference: %s", e)
             return {
                 "has_direct_answer": False,
                 "has_inference": False,
@@ -243,29 +380,11 @@ class MemoryReasoner:
         Build a system prompt that guides the LLM through reasoning logic.
         """
         
-        # Build recent context safely
-        recent_context_lines = []
-        if conversation_history:
-            for m in conversation_history[-3:]:
-                if isinstance(m, dict) and 'role' in m and 'content' in m:
-                    role = m['role'].upper()
-                    content = m['content'][:100]
-                    recent_context_lines.append(f"{role}: {content}")
-        
-        recent_context = "\n".join(recent_context_lines) if recent_context_lines else "No recent context"
+        recent_context = self._get_recent_context(conversation_history)
         
-        prompt = f"""You are an expert at logical reasoning over user preferences and facts.
-
-Your task is to analyze whether the user's question can be INFERRED from their stored memories, even if they haven't explicitly stated the answer.
-
-STRICT RULES:
-1. ONLY infer if there is a clear logical chain from stored facts to the question
-2. You MAY use common world knowledge to connect a stored preference to a specific instance
-3. If a memory expresses a GENERAL preference (e.g., favorite character type), apply it to general queries about favorites
-4. If the user asks about a specific series/film, map the general preference to that series using common knowledge
-5. DO NOT make assumptions or fill in gaps that aren't supported by memories or common knowledge
-6. If uncertain, explicitly say you cannot make a confident inference
-7. Be specific about WHY you can or cannot make the inference
+        # Static prefix first so provider-side prompt caching can reuse it;
+        # the per-request memories, context and question go last
+        prompt = _REASONING_PROMPT_PREFIX + f"""
 
 USER'S STORED MEMORIES:
 {memories_text}
@@ -274,29 +393,7 @@ RECENT CONVERSATION CONTEXT:
 {recent_context}
 
 USER'S QUESTION:
-{user_query}
-
-EXAMPLE:
-- Memory: preference favorite_anime_character_type = "main character"
-- Question: "Who is my favorite character in Black Clover?"
-- Inference: The user prefers main characters; the main character of Black Clover is Asta.
-
-Now analyze:
-1. Can you find the DIRECT ANSWER in memories? (Yes/No)
-2. If not, can you INFER the answer from logical relationships between memories? (Yes/No)
-3. What is the REASONING CHAIN? (Step by step logic)
-4. What is your CONFIDENCE LEVEL? (0-1)
-5. What is the INFERRED ANSWER if applicable?
-6. Which MEMORY SOURCES support this inference?
-
-Format your response as:
-DIRECT_ANSWER: [yes/no]
-INFERENCE_POSSIBLE: [yes/no]
-REASONING_CHAIN: [explanation]
-CONFIDENCE: [0.0-1.0]
-INFERRED_ANSWER: [answer or "N/A"]
-SOURCES: [list of memory keys used]
-EXPLANATION: [brief explanation of why or why not]"""
+{user_query}"""
         
         return prompt
     
@@ -320,40 +417,49 @@ EXPLANATION: [brief explanation of why or why not]"""
             "should_use": False
         }
         
-        lines = llm_response.split('\n')
-        
         try:
-            for line in lines:
-                line = line.strip()
-                
-                if line.startswith("DIRECT_ANSWER:"):
-                    result["has_direct_answer"] = "yes" in line.lower()
-                
-                elif line.startswith("INFERENCE_POSSIBLE:"):
-                    result["has_inference"] = "yes" in line.lower()
-                
-                elif line.startswith("REASONING_CHAIN:"):
-                    result["inference_chain"] = line.replace("REASONING_CHAIN:", "").strip()
-                
-                elif line.startswith("CONFIDENCE:"):
-                    try:
-                        conf_str = line.replace("CONFIDENCE:", "").strip()
-                        result["confidence"] = float(conf_str)
-                    except ValueError:
-                        result["confidence"] = 0.0
-                
-                elif line.startswith("INFERRED_ANSWER:"):
-                    answer = line.replace("INFERRED_ANSWER:", "").strip()
-                    if answer.lower() != "n/a":
-                        result["inferred_answer"] = answer
-                
-                elif line.startswith("SOURCES:"):
-                    sources_str = line.replace("SOURCES:", "").strip()
-                    result["sources"] = [s.strip() for s in sources_str.split(',') if s.strip()]
-                
-                elif line.startswith("EXPLANATION:"):
-                    # Could store this for debugging
-                    pass
+            data = self._load_reasoning_json(llm_response)
+            if data is not None:
+                result["has_direct_answer"] = _as_bool(data.get("direct_answer"))
+                result["has_inference"] = _as_bool(data.get("inference_possible"))
+                result["inference_chain"] = str(data.get("reasoning_chain") or "")
+                try:
+                    result["confidence"] = float(data.get("confidence") or 0.0)
+                except (TypeError, ValueError):
+                    result["confidence"] = 0.0
+                answer = str(data.get("inferred_answer") or "").strip()
+                if answer.lower() != "n/a":
+                    result["inferred_answer"] = answer
+                sources = data.get("sources") or []
+                if isinstance(sources, str):
+                    sources = sources.split(',')
+                result["sources"] = [str(s).strip() for s in sources if str(s).strip()]
+            else:
+                # Fallback: one pass over "FIELD: value" lines
+                for match in _REASONING_FIELD_RE.finditer(llm_response):
+                    field, value = match.group(1), match.group(2).strip()
+                    
+                    if field == "DIRECT_ANSWER":
+                        result["has_direct_answer"] = "yes" in value.lower()
+                    
+                    elif field == "INFERENCE_POSSIBLE":
+                        result["has_inference"] = "yes" in value.lower()
+                    
+                    elif field == "REASONING_CHAIN":
+                        result["inference_chain"] = value
+                    
+                    elif field == "CONFIDENCE":
+                        try:
+                            result["confidence"] = float(value)
+                        except ValueError:
+                            result["confidence"] = 0.0
+                    
+                    elif field == "INFERRED_ANSWER":
+                        if value.lower() != "n/a":
+                            result["inferred_answer"] = value
+                    
+                    elif field == "SOURCES":
+                        result["sources"] = [s.strip() for s in value.split(',') if s.strip()]
             
             # Determine if we should use this inference
             # Only use if:
@@ -366,6 +472,18 @@ EXPLANATION: [brief explanation of why or why not]"""
                 result["should_use"] = True
         
         except Exception as e:
-            print(f"Error parsing reasoning response: {e}")
+            logger.warning("Error parsing reasoning response: %s", e)
         
         return result
+    
+    def _load_reasoning_json(self, llm_response: str) -> Optional[Dict[str, Any]]:
+        """Parse the JSON object in the response, or return None if there is none."""
+        start = llm_response.find("{")
+        end = llm_response.rfind("}")
+        if start == -1 or end <= start:
+            return None
+        try:
+            data = json.loads(llm_response[start:end + 1])
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
@@ -1,74 +1,367 @@
+from __future__ import annotations
+
 import uuid
 import pickle
 import os
+import json
+import asyncio
+import logging
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 import faiss
 
 from app.config import settings
 from app.models.memory import Memory
 
+if TYPE_CHECKING:
+    # Legacy SQL session type; sqlalchemy is not a runtime dependency of the Mongo app
+    from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# FAISS parallelizes search over OpenMP threads; 0 means one per CPU core
+faiss.omp_set_num_threads(settings.FAISS_THREADS or os.cpu_count() or 1)
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; fall back to plain Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def _fuse_scores(sim, imp, turn, current_turn, conf_thresh):
+    """
+    Fuse similarity with importance and recency boosts.
+    Returns (mask of results above the confidence threshold, final scores).
+    """
+    n = sim.shape[0]
+    mask = np.empty(n, dtype=np.bool_)
+    final = np.empty(n, dtype=np.float64)
+    for i in range(n):
+        recency = 0.0
+        if current_turn != 0:
+            # Exponential decay: newer memories get higher boost (~100 turns)
+            recency = 0.1 * np.exp(-(current_turn - turn[i]) / 100.0)
+        final[i] = sim[i] + imp[i] * 0.2 + recency
+        mask[i] = sim[i] >= conf_thresh
+    return mask, final
+
+
+_SHARED_EMBEDDER: Optional[SentenceTransformer] = None
+
+
+def _get_embedder() -> SentenceTransformer:
+    """
+    Load the SentenceTransformer once per process, shared by every MemoryStore.
+    Runs on the GPU in half precision when one is available.
+    """
+    global _SHARED_EMBEDDER
+    if _SHARED_EMBEDDER is None:
+        import torch
+        if torch.cuda.is_available():
+            _SHARED_EMBEDDER = SentenceTransformer(settings.EMBEDDING_MODEL, device='cuda').half()
+        else:
+            _SHARED_EMBEDDER = SentenceTransformer(settings.EMBEDDING_MODEL, device='cpu')
+    return _SHARED_EMBEDDER
+
+
+# Per-memory columns kept alongside id_map, indexed by FAISS id
+_COLUMN_DTYPES = {
+    'importance': np.float32,
+    'turn_number': np.int32,
+    'mem_type': object,
+    'db_id': np.int64,
+    'vector_id': object,
+    'active': np.bool_,
+}
+
+
+@lru_cache(maxsize=1)
+def get_memory_store() -> "MemoryStore":
+    """Process-wide MemoryStore, so per-user indexes are loaded from disk once."""
+    return MemoryStore()
+
 
 class MemoryStore:
     """Manages vector storage and retrieval of memories using FAISS."""
     
     def __init__(self):
-        self.embedder = SentenceTransformer(settings.EMBEDDING_MODEL)
+        self.embedder = _get_embedder()
         self.index = None
         self.memories = {}
         self.user_memories = {}  # Separate index per user
-        self.index_file = "faiss_index.pkl"
+        self.index_file = "faiss_index.pkl"  # Legacy single-pickle format
+        self.index_dir = "faiss_index"  # {user_id}.faiss + {user_id}.jsonl per user
+        self._dirty_users = set()  # Users whose FAISS index needs writing
+        self._flush_task = None
+        self._flush_delay = 1.0  # Seconds to coalesce bursts of writes
+        self._formatted_text_cache: Dict[str, str] = {}  # user_id -> get_formatted_memory_text
+        self._train_size = 256  # Vectors buffered before training the 8-bit quantizer
+        # Memoized single-text embeddings for repeated queries
+        self._encode_cached = lru_cache(maxsize=4096)(self._encode_one)
         self._load_index()
     
+    def _index_path(self, user_key: str) -> str:
+        return os.path.join(self.index_dir, f"{user_key}.faiss")
+    
+    def _id_map_path(self, user_key: str) -> str:
+        return os.path.join(self.index_dir, f"{user_key}.jsonl")
+    
+    def _pending_path(self, user_key: str) -> str:
+        return os.path.join(self.index_dir, f"{user_key}.pending.npy")
+    
     def _load_index(self):
-        """Load or create FAISS index."""
-        if os.path.exists(self.index_file):
+        """Load per-user FAISS indexes and id maps, or create empty state."""
+        self.user_memories = {}
+        self.memories = {}
+        
+        if os.path.isdir(self.index_dir):
+            for filename in os.listdir(self.index_dir):
+                if not filename.endswith(".faiss"):
+                    continue
+                user_key = filename[:-len(".faiss")]
+                try:
+                    index = faiss.read_index(self._index_path(user_key))
+                    id_map = {}
+                    inactive = set()
+                    if os.path.exists(self._id_map_path(user_key)):
+                        with open(self._id_map_path(user_key)) as f:
+                            for line in f:
+                                if line.strip():
+                                    row = json.loads(line)
+                                    if row.get('inactive'):
+                                        # Tombstone written by deactivate_memory
+                                        inactive.add(row['faiss_id'])
+                                        continue
+                                    faiss_id = row.pop('faiss_id')
+                                    id_map[faiss_id] = row
+                                    inactive.discard(faiss_id)
+                    pending = self._empty_pending()
+                    if os.path.exists(self._pending_path(user_key)):
+                        if index.is_trained:
+                            # Training adds every pending vector, so a pending file next
+                            # to a trained index is left over from an interrupted save
+                            os.remove(self._pending_path(user_key))
+                        else:
+                            pending = np.load(self._pending_path(user_key))
+                    next_id = index.ntotal + len(pending)
+                    # Rows are appended at once but the index write is debounced, so a
+                    # crash can leave rows for vectors that never reached disk
+                    orphaned = [faiss_id for faiss_id in id_map if faiss_id >= next_id]
+                    if orphaned or any(faiss_id >= next_id for faiss_id in inactive):
+                        logger.warning(
+                            "Dropping %d id map row(s) past the saved index for user %s",
+                            len(orphaned), user_key
+                        )
+                        for faiss_id in orphaned:
+                            del id_map[faiss_id]
+                        inactive = {faiss_id for faiss_id in inactive if faiss_id < next_id}
+                        self._write_id_map(user_key, id_map, inactive)
+                    cols = self._build_cols(id_map, next_id)
+                    cols['active'][list(inactive)] = False
+                    self.user_memories[user_key] = {
+                        'index': index,
+                        'id_map': id_map,
+                        'cols': cols,
+                        'pending': pending,
+                        'next_id': next_id
+                    }
+                except Exception as e:
+                    logger.error("Error loading index for user %s: %s", user_key, e)
+        elif os.path.exists(self.index_file):
+            # Migrate the legacy single-pickle format to per-user files
             try:
                 with open(self.index_file, 'rb') as f:
                     data = pickle.load(f)
                     self.user_memories = data.get('user_memories', {})
                     self.memories = data.get('memories', {})
+                for user_key, user_index_data in self.user_memories.items():
+                    user_index_data.setdefault('pending', self._empty_pending())
+                    user_index_data['cols'] = self._build_cols(
+                        user_index_data['id_map'], user_index_data['next_id']
+                    )
+                    self._write_id_map(user_key, user_index_data['id_map'])
+                self._dirty_users.update(self.user_memories)
+                self._save_index()
             except Exception as e:
-                print(f"Error loading index: {e}")
+                logger.error("Error loading index: %s", e)
                 self.user_memories = {}
                 self.memories = {}
-        else:
-            self.user_memories = {}
-            self.memories = {}
+    
+    def _write_id_map(self, user_key: str, id_map: Dict[int, Dict[str, Any]], inactive=()):
+        """Rewrite a user's whole id map sidecar (migration and load repair)."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        path = self._id_map_path(user_key)
+        with open(path + ".tmp", 'w') as f:
+            for faiss_id, entry in id_map.items():
+                f.write(json.dumps({'faiss_id': faiss_id, **entry}, default=str) + "\n")
+            for faiss_id in inactive:
+                f.write(json.dumps({'faiss_id': faiss_id, 'inactive': True}) + "\n")
+        os.replace(path + ".tmp", path)
+    
+    def _append_id_map_entry(self, user_key: str, faiss_id: int, entry: Dict[str, Any]):
+        """Append one id map row to the user's JSONL sidecar."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self._id_map_path(user_key), 'a') as f:
+            f.write(json.dumps({'faiss_id': faiss_id, **entry}, default=str) + "\n")
+    
+    def _append_tombstone(self, user_key: str, faiss_id: int):
+        """Record a deactivated FAISS id in the user's JSONL sidecar."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self._id_map_path(user_key), 'a') as f:
+            f.write(json.dumps({'faiss_id': faiss_id, 'inactive': True}) + "\n")
     
     def _save_index(self):
-        """Save FAISS index to disk."""
+        """Write the FAISS index of every user with unsaved changes."""
+        if not self._dirty_users:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        dirty, self._dirty_users = self._dirty_users, set()
+        for user_key in dirty:
+            try:
+                user_index_data = self.user_memories[user_key]
+                # Write to a temp file and swap it in, so a crash never leaves a torn index
+                index_path = self._index_path(user_key)
+                faiss.write_index(user_index_data['index'], index_path + ".tmp")
+                os.replace(index_path + ".tmp", index_path)
+                # Only then drop the pending file: once trained, the index holds those
+                # vectors, and a stale file next to a trained index is ignored on load
+                pending_path = self._pending_path(user_key)
+                if len(user_index_data['pending']):
+                    with open(pending_path + ".tmp", 'wb') as f:
+                        np.save(f, user_index_data['pending'])
+                    os.replace(pending_path + ".tmp", pending_path)
+                elif os.path.exists(pending_path):
+                    os.remove(pending_path)
+            except Exception as e:
+                logger.error("Error saving index for user %s: %s", user_key, e)
+                self._dirty_users.add(user_key)
+    
+    def _schedule_save(self, user_key: str):
+        """Mark a user's index dirty and write it after a short debounce."""
+        self._dirty_users.add(user_key)
         try:
-            with open(self.index_file, 'wb') as f:
-                pickle.dump({
-                    'user_memories': self.user_memories,
-                    'memories': self.memories
-                }, f)
-        except Exception as e:
-            print(f"Error saving index: {e}")
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop to debounce on: write now
+            self._save_index()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_save())
+    
+    async def _delayed_save(self):
+        await asyncio.sleep(self._flush_delay)
+        self._save_index()
     
     def _get_user_index(self, user_id: int):
         """Get or create FAISS index for a user."""
         user_key = str(user_id)
         if user_key not in self.user_memories:
-            # Create new index: 384 dimensions (MiniLM), Inner Product (cosine similarity)
-            index = faiss.IndexFlatIP(384)
+            # Create new index: 384 dimensions (MiniLM), HNSW graph over 8-bit
+            # scalar-quantized vectors, Inner Product (cosine similarity)
+            index = faiss.IndexHNSWSQ(384, faiss.ScalarQuantizer.QT_8bit, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 64
+            # Sidecars without a loadable index (e.g. a crash before the first
+            # index write) describe vectors that are gone; don't append to them
+            for stale_path in (self._id_map_path(user_key), self._pending_path(user_key)):
+                if os.path.exists(stale_path):
+                    logger.warning("Discarding stale %s for user %s", stale_path, user_key)
+                    os.remove(stale_path)
             self.user_memories[user_key] = {
                 'index': index,
                 'id_map': {},  # Maps FAISS index position to memory data
+                'cols': self._build_cols({}, 0),  # Scoring fields as arrays, by FAISS id
+                'pending': self._empty_pending(),  # Vectors waiting for quantizer training
                 'next_id': 0
             }
         return self.user_memories[user_key]
     
+    def _build_cols(self, id_map: Dict[int, Dict[str, Any]], size: int) -> Dict[str, np.ndarray]:
+        """Build the column arrays for an id map with FAISS ids below size."""
+        cols = {name: np.empty(size, dtype=dtype) for name, dtype in _COLUMN_DTYPES.items()}
+        cols['active'][:] = False  # Ids without a row never score
+        for faiss_id, entry in id_map.items():
+            self._set_cols(cols, faiss_id, entry)
+        return cols
+    
+    def _set_cols(self, cols: Dict[str, np.ndarray], faiss_id: int, entry: Dict[str, Any]):
+        metadata = entry['metadata']
+        cols['importance'][faiss_id] = metadata.get('importance', 0.5)
+        cols['turn_number'][faiss_id] = metadata.get('turn_number', 0)
+        cols['mem_type'][faiss_id] = metadata['type']
+        cols['db_id'][faiss_id] = entry['db_id']
+        cols['vector_id'][faiss_id] = entry['vector_id']
+        cols['active'][faiss_id] = True
+    
+    def _reserve_cols(self, user_index_data: Dict[str, Any], size: int):
+        """Grow the column arrays to hold at least size rows (amortized doubling)."""
+        cols = user_index_data['cols']
+        capacity = len(cols['importance'])
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2, 16)
+        for name in cols:
+            cols[name] = np.resize(cols[name], new_capacity)
+    
+    def _empty_pending(self) -> np.ndarray:
+        return np.empty((0, 384), dtype='float32')
+    
+    def _add_embeddings(self, user_index_data: Dict[str, Any], embeddings: np.ndarray):
+        """
+        Add embeddings to a user's index.
+        The quantizer needs training data, so the first vectors are buffered
+        until there are enough to train on, then added in order.
+        """
+        index = user_index_data['index']
+        if index.is_trained:
+            index.add(embeddings)
+            return
+        pending = np.vstack([user_index_data['pending'], embeddings])
+        if len(pending) >= self._train_size:
+            index.train(pending)
+            index.add(pending)
+            pending = self._empty_pending()
+        user_index_data['pending'] = pending
+    
+    def _get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Generate unit-norm embeddings for a batch of texts in one encode call."""
+        embeddings = self.embedder.encode(
+            texts,
+            batch_size=64,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            normalize_embeddings=True  # Cosine similarity via inner product
+        )
+        return embeddings.astype('float32')
+    
+    def _encode_one(self, text: str) -> np.ndarray:
+        embedding = self.embedder.encode(
+            text,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            normalize_embeddings=True
+        )
+        # One contiguous (1, d) float32 row, ready for index.search as-is
+        embedding = np.ascontiguousarray(embedding.reshape(1, -1), dtype=np.float32)
+        embedding.flags.writeable = False  # Shared by every cache hit
+        return embedding
+    
     def _get_embedding(self, text: str) -> np.ndarray:
-        """Generate embedding for text."""
-        embedding = self.embedder.encode(text, convert_to_numpy=True)
-        # Normalize for cosine similarity
-        faiss.normalize_L2(embedding.reshape(1, -1))
-        return embedding.astype('float32')
+        """Generate a (1, d) embedding for text (cached for repeated queries)."""
+        return self._encode_cached(text)
+    
+    async def _aget_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding for text in a worker thread, off the event loop."""
+        return await asyncio.to_thread(self._encode_cached, text)
+    
+    def _embedding_text(self, memory_data: Dict[str, Any]) -> str:
+        return f"{memory_data['type']}: {memory_data['key']} - {memory_data['value']}"
     
     def store_memory(
         self,
@@ -79,64 +372,123 @@ class MemoryStore:
         turn_number: int
     ) -> Memory:
         """Store a new memory in both SQL and FAISS."""
-        
-        # Create SQL record first
-        vector_id = str(uuid.uuid4())
-        
-        # Determine expiration for time-sensitive memories
-        expires_at = None
-        if memory_data['type'] in ['commitment', 'instruction']:
-            expires_at = datetime.utcnow() + timedelta(days=30)
-        
-        db_memory = Memory(
-            user_id=user_id,
-            memory_type=memory_data['type'],
-            key=memory_data['key'],
-            value=memory_data['value'],
-            context=memory_data.get('context', ''),
-            source_conversation_id=conversation_id,
-            source_turn=turn_number,
-            confidence=memory_data.get('confidence', 0.5),
-            importance_score=memory_data.get('importance', 0.5),
-            vector_id=vector_id,
-            expires_at=expires_at
+        return self.store_memories(db, user_id, [memory_data], conversation_id, turn_number)[0]
+    
+    async def astore_memory(
+        self,
+        db: Session,
+        user_id: int,
+        memory_data: Dict[str, Any],
+        conversation_id: int,
+        turn_number: int
+    ) -> Memory:
+        """Async variant of store_memory that encodes off the event loop."""
+        return (await self.astore_memories(db, user_id, [memory_data], conversation_id, turn_number))[0]
+    
+    async def astore_memories(
+        self,
+        db: Session,
+        user_id: int,
+        memories_data: List[Dict[str, Any]],
+        conversation_id: int,
+        turn_number: int
+    ) -> List[Memory]:
+        """Async variant of store_memories that encodes off the event loop."""
+        if not memories_data:
+            return []
+        embeddings = await asyncio.to_thread(
+            self._get_embeddings,
+            [self._embedding_text(memory_data) for memory_data in memories_data]
+        )
+        return self.store_memories(
+            db, user_id, memories_data, conversation_id, turn_number, embeddings=embeddings
         )
+    
+    def store_memories(
+        self,
+        db: Session,
+        user_id: int,
+        memories_data: List[Dict[str, Any]],
+        conversation_id: int,
+        turn_number: int,
+        embeddings: Optional[np.ndarray] = None
+    ) -> List[Memory]:
+        """
+        Store several memories from one turn in both SQL and FAISS.
+        Uses one commit and one batched embedding call for the whole list
+        (skipped when precomputed embeddings are passed in).
+        """
+        if not memories_data:
+            return []
+        
+        # Create SQL records first
+        db_memories = []
+        for memory_data in memories_data:
+            # Determine expiration for time-sensitive memories
+            expires_at = None
+            if memory_data['type'] in ['commitment', 'instruction']:
+                expires_at = datetime.utcnow() + timedelta(days=30)
+            
+            db_memories.append(Memory(
+                user_id=user_id,
+                memory_type=memory_data['type'],
+                key=memory_data['key'],
+                value=memory_data['value'],
+                context=memory_data.get('context', ''),
+                source_conversation_id=conversation_id,
+                source_turn=turn_number,
+                confidence=memory_data.get('confidence', 0.5),
+                importance_score=memory_data.get('importance', 0.5),
+                vector_id=str(uuid.uuid4()),
+                expires_at=expires_at
+            ))
         
-        db.add(db_memory)
+        db.add_all(db_memories)
         db.commit()
-        db.refresh(db_memory)
+        for db_memory in db_memories:
+            db.refresh(db_memory)
         
         # Add to FAISS index
         user_index_data = self._get_user_index(user_id)
-        index = user_index_data['index']
         
-        # Create embedding
-        embedding_text = f"{memory_data['type']}: {memory_data['key']} - {memory_data['value']}"
-        embedding = self._get_embedding(embedding_text)
+        # Create embeddings in one batch
+        embedding_texts = [self._embedding_text(memory_data) for memory_data in memories_data]
+        if embeddings is None:
+            embeddings = self._get_embeddings(embedding_texts)
         
         # Add to index
-        index.add(embedding.reshape(1, -1))
-        
-        # Store mapping
-        faiss_id = user_index_data['next_id']
-        user_index_data['id_map'][faiss_id] = {
-            'db_id': db_memory.id,
-            'vector_id': vector_id,
-            'content': embedding_text,
-            'metadata': {
-                'type': memory_data['type'],
-                'key': memory_data['key'],
-                'value': memory_data['value'],
-                'turn_number': turn_number,
-                'confidence': memory_data.get('confidence', 0.5),
-                'importance': memory_data.get('importance', 0.5)
+        self._add_embeddings(user_index_data, embeddings)
+        
+        # Store mappings
+        user_key = str(user_id)
+        self._reserve_cols(user_index_data, user_index_data['next_id'] + len(memories_data))
+        for memory_data, db_memory, embedding_text in zip(memories_data, db_memories, embedding_texts):
+            faiss_id = user_index_data['next_id']
+            entry = {
+                'db_id': db_memory.id,
+                'vector_id': db_memory.vector_id,
+                'content': embedding_text,
+                'metadata': {
+                    'type': memory_data['type'],
+                    'key': memory_data['key'],
+                    'value': memory_data['value'],
+                    'turn_number': turn_number,
+                    'confidence': memory_data.get('confidence', 0.5),
+                    'importance': memory_data.get('importance', 0.5)
+                }
             }
-        }
-        user_index_data['next_id'] += 1
+            user_index_data['id_map'][faiss_id] = entry
+            self._set_cols(user_index_data['cols'], faiss_id, entry)
+            user_index_data['next_id'] += 1
+            
+            # Persist only this user's state: append the new row
+            self._append_id_map_entry(user_key, faiss_id, entry)
         
-        self._save_index()
+        # Debounce the index write
+        self._schedule_save(user_key)
+        self._formatted_text_cache.pop(user_key, None)
         
-        return db_memory
+        return db_memories
     
     def retrieve_relevant_memories(
         self,
@@ -144,67 +496,175 @@ class MemoryStore:
         query: str,
         current_turn: int,
         top_k: int = None,
+        memory_types: Optional[List[str]] = None,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve relevant memories using FAISS.
+        Pass query_embedding to reuse an embedding already computed for this query.
+        """
+        if str(user_id) not in self.user_memories:
+            return []
+        if query_embedding is None:
+            query_embedding = self._get_embedding(query)
+        return self._search(user_id, query_embedding, current_turn, top_k, memory_types)
+    
+    async def aretrieve_relevant_memories(
+        self,
+        user_id: int,
+        query: str,
+        current_turn: int,
+        top_k: int = None,
+        memory_types: Optional[List[str]] = None,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """Async variant of retrieve_relevant_memories; encode and search run in worker threads."""
+        if str(user_id) not in self.user_memories:
+            return []
+        if query_embedding is None:
+            query_embedding = await self._aget_embedding(query)
+        return await asyncio.to_thread(
+            self._search, user_id, query_embedding, current_turn, top_k, memory_types
+        )
+    
+    def retrieve_relevant_memories_batch(
+        self,
+        user_id: int,
+        queries: List[str],
+        current_turn: int,
+        top_k: int = None,
+        memory_types: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve relevant memories for several queries at once.
+        Encodes all queries in one batch and searches them in a single FAISS call.
+        Returns one result list per query, in order.
+        """
+        if not queries or str(user_id) not in self.user_memories:
+            return [[] for _ in queries]
+        return self._search_batch(user_id, self._get_embeddings(queries), current_turn, top_k, memory_types)
+    
+    def _search(
+        self,
+        user_id: int,
+        query_embedding: np.ndarray,  # (1, d), as returned by _get_embedding
+        current_turn: int,
+        top_k: int = None,
         memory_types: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
-        """Retrieve relevant memories using FAISS."""
+        """Search a user's index with a precomputed query embedding and score the hits."""
+        return self._search_batch(user_id, query_embedding, current_turn, top_k, memory_types)[0]
+    
+    def _search_batch(
+        self,
+        user_id: int,
+        query_embeddings: np.ndarray,  # (q, d)
+        current_turn: int,
+        top_k: int = None,
+        memory_types: Optional[List[str]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Search a user's index with a matrix of query embeddings and score all hits together."""
         
         if top_k is None:
             top_k = settings.MEMORY_TOP_K
         
+        n_queries = len(query_embeddings)
         user_key = str(user_id)
         if user_key not in self.user_memories:
-            return []
+            return [[] for _ in range(n_queries)]
         
         user_index_data = self.user_memories[user_key]
         index = user_index_data['index']
         id_map = user_index_data['id_map']
+        pending = user_index_data['pending']
+        
+        if index.ntotal == 0 and len(pending) == 0:
+            return [[] for _ in range(n_queries)]
         
         if index.ntotal == 0:
-            return []
+            # Quantizer not trained yet: exact search over the buffered vectors
+            k = min(top_k * 2, len(pending))
+            sims = query_embeddings @ pending.T
+            indices = np.argsort(-sims, axis=1)[:, :k]
+            scores = np.take_along_axis(sims, indices, axis=1)
+        else:
+            # Search (indexes saved before the HNSW switch are still flat)
+            if hasattr(index, 'hnsw'):
+                index.hnsw.efSearch = max(top_k * 4, 32)
+            scores, indices = index.search(query_embeddings, min(top_k * 2, index.ntotal))
         
-        # Generate query embedding
-        query_embedding = self._get_embedding(query)
+        # Score candidates of every query from the column arrays in one compiled pass
+        cols = user_index_data['cols']
+        ids = indices.ravel()
+        sims = scores.ravel()
+        rows = np.repeat(np.arange(n_queries), indices.shape[1])
+        valid = ids >= 0
+        # Skip deactivated memories
+        valid &= cols['active'][np.where(valid, ids, 0)]
+        if memory_types:
+            # Filter by memory type if specified
+            valid &= np.isin(cols['mem_type'][np.where(valid, ids, 0)], memory_types)
+        ids = ids[valid]
+        sims = sims[valid].astype(np.float64)
+        rows = rows[valid]
         
-        # Search
-        scores, indices = index.search(query_embedding.reshape(1, -1), min(top_k * 2, index.ntotal))
+        results = [[] for _ in range(n_queries)]
+        if len(ids) == 0:
+            return results
         
-        memories = []
-        for i, idx in enumerate(indices[0]):
-            if idx == -1 or idx not in id_map:
-                continue
-            
-            mem_data = id_map[idx]
-            
-            # Filter by memory type if specified
-            if memory_types and mem_data['metadata']['type'] not in memory_types:
-                continue
-            
-            # Calculate final score with importance and recency
-            similarity = float(scores[0][i])
-            importance_boost = mem_data['metadata'].get('importance', 0.5) * 0.2
-            recency_boost = self._calculate_recency_boost(
-                mem_data['metadata'].get('turn_number', 0),
-                current_turn
-            )
-            
-            final_score = similarity + importance_boost + recency_boost
-            
-            # Filter by confidence threshold
-            if similarity < settings.MEMORY_CONFIDENCE_THRESHOLD:
+        mask, final_scores = _fuse_scores(
+            sims,
+            cols['importance'][ids].astype(np.float64),
+            cols['turn_number'][ids].astype(np.float64),
+            current_turn,
+            settings.MEMORY_CONFIDENCE_THRESHOLD
+        )
+        
+        for i in np.flatnonzero(mask):
+            mem_data = id_map.get(int(ids[i]))
+            if mem_data is None:
                 continue
-            
-            memories.append({
-                'vector_id': mem_data['vector_id'],
-                'db_id': mem_data['db_id'],
+            results[rows[i]].append({
+                'vector_id': cols['vector_id'][ids[i]],
+                'db_id': int(cols['db_id'][ids[i]]),
                 'content': mem_data['content'],
-                'similarity': similarity,
-                'final_score': final_score,
+                'similarity': float(sims[i]),
+                'final_score': float(final_scores[i]),
                 'metadata': mem_data['metadata']
             })
         
-        # Sort by final score and return top_k
-        memories.sort(key=lambda x: x['final_score'], reverse=True)
-        return memories[:top_k]
+        # Sort by final score and return top_k per query
+        for memories in results:
+            memories.sort(key=lambda x: x['final_score'], reverse=True)
+        return [memories[:top_k] for memories in results]
+    
+    def get_formatted_memory_text(self, user_id: int) -> str:
+        """
+        Render a user's active memories grouped by type, in the reasoning prompt format.
+        Memoized per user until store_memory / deactivate_memory changes their memories.
+        """
+        user_key = str(user_id)
+        cached = self._formatted_text_cache.get(user_key)
+        if cached is not None:
+            return cached
+        
+        user_index_data = self.user_memories.get(user_key)
+        grouped = {}
+        if user_index_data is not None:
+            active = user_index_data['cols']['active']
+            for faiss_id, mem_data in user_index_data['id_map'].items():
+                if active[faiss_id]:
+                    grouped.setdefault(mem_data['metadata']['type'], []).append(mem_data['metadata'])
+        
+        lines = []
+        for mem_type, metas in grouped.items():
+            lines.append(f"\n{mem_type.upper()}S:")
+            for meta in metas:
+                lines.append(f"  - {meta['key']}: {meta['value']} (source: turn {meta.get('turn_number', 0)})")
+        
+        text = "\n".join(lines)
+        self._formatted_text_cache[user_key] = text
+        return text
     
     def _calculate_recency_boost(self, source_turn: int, current_turn: int) -> float:
         """Calculate recency boost for memory scoring."""
@@ -240,10 +700,35 @@ class MemoryStore:
             memory.last_accessed_turn = current_turn
             db.commit()
     
+    def bulk_update_access(self, db: Session, memory_ids: List[int], current_turn: int):
+        """Update access statistics for several memories in one UPDATE and commit."""
+        if not memory_ids:
+            return
+        db.query(Memory).filter(Memory.id.in_(memory_ids)).update(
+            {
+                Memory.access_count: Memory.access_count + 1,
+                Memory.last_accessed_turn: current_turn
+            },
+            synchronize_session=False
+        )
+        db.commit()
+    
     def deactivate_memory(self, db: Session, memory_id: int):
         """Soft delete a memory."""
         memory = db.query(Memory).filter(Memory.id == memory_id).first()
         if memory:
             memory.is_active = False
             db.commit()
-            self._save_index()
\ No newline at end of file
+            
+            # FAISS data is untouched: tombstone the vector instead of rewriting the index
+            user_key = str(memory.user_id)
+            self._formatted_text_cache.pop(user_key, None)
+            user_index_data = self.user_memories.get(user_key)
+            if user_index_data is None:
+                return
+            cols = user_index_data['cols']
+            next_id = user_index_data['next_id']
+            for faiss_id in np.flatnonzero(cols['db_id'][:next_id] == memory_id):
+                if cols['active'][faiss_id]:
+                    cols['active'][faiss_id] = False
+                    self._append_tombstone(user_key, int(faiss_id))
\ No newline at end of file
@@ -1,14 +1,48 @@
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+import ahocorasick
+import numpy as np
 from app.config import settings
-from app.core.memory_store import MemoryStore
+from app.core.memory_store import MemoryStore, get_memory_store
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+
+
+def _final_score(mem: Dict[str, Any]) -> float:
+    return mem.get('final_score', 0)
 
 
 class MemoryRetriever:
     """Orchestrates memory retrieval for inference."""
     
     def __init__(self):
-        self.store = MemoryStore()
+        self.store: MemoryStore = get_memory_store()
+        self._intent_automaton = self._build_intent_automaton()
+    
+    def _build_intent_automaton(self) -> "ahocorasick.Automaton":
+        """Build one automaton mapping intent keywords to the memory types they imply."""
+        intent_keywords = {
+            # Time-related queries
+            'commitment': ['when', 'time', 'schedule', 'tomorrow', 'today'],
+            # Preference-related
+            'preference': ['prefer', 'like', 'want', 'need'],
+            # Personal info
+            'fact': ['who', 'where', 'what about'],
+            'entity': ['who', 'where', 'what about'],
+        }
+        keyword_intents = {}
+        for intent, words in intent_keywords.items():
+            for word in words:
+                keyword_intents.setdefault(word, []).append(intent)
+        
+        automaton = ahocorasick.Automaton()
+        for word, intents in keyword_intents.items():
+            automaton.add_word(word, tuple(intents))
+        automaton.make_automaton()
+        return automaton
     
     async def retrieve_for_inference(
         self,
@@ -26,19 +60,24 @@ class MemoryRetriever:
             Dictionary with retrieved memories and metadata
         """
         
+        # Embed the message once for both searches
+        query_embedding = await self.store._aget_embedding(current_message)
+        
         # 1. Semantic search with current message
-        semantic_memories = self.store.retrieve_relevant_memories(
+        semantic_memories = await self.store.aretrieve_relevant_memories(
             user_id=user_id,
             query=current_message,
             current_turn=current_turn,
-            top_k=settings.MEMORY_TOP_K
+            top_k=settings.MEMORY_TOP_K,
+            query_embedding=query_embedding
         )
         
         # 2. Check for specific memory types based on intent
         intent_memories = await self._retrieve_by_intent(
             user_id=user_id,
             message=current_message,
-            current_turn=current_turn
+            current_turn=current_turn,
+            query_embedding=query_embedding
         )
         
         # 3. Get critical high-importance memories (always include these)
@@ -59,9 +98,11 @@ class MemoryRetriever:
         formatted_memories = self._format_for_prompt(all_memories)
         
         # 6. Update access stats
-        for mem in all_memories:
-            if 'db_id' in mem:
-                self.store.update_memory_access(db, mem['db_id'], current_turn)
+        self.store.bulk_update_access(
+            db,
+            [mem['db_id'] for mem in all_memories if 'db_id' in mem],
+            current_turn
+        )
         
         return {
             'memories': formatted_memories,
@@ -79,36 +120,28 @@ class MemoryRetriever:
         self,
         user_id: int,
         message: str,
-        current_turn: int
+        current_turn: int,
+        query_embedding: Optional[np.ndarray] = None
     ) -> List[Dict[str, Any]]:
         """Retrieve memories based on detected intent."""
         
-        # Simple keyword-based intent detection
+        # Simple keyword-based intent detection, in one pass over the message
         intents = []
-        message_lower = message.lower()
-        
-        # Time-related queries
-        if any(word in message_lower for word in ['when', 'time', 'schedule', 'tomorrow', 'today']):
-            intents.append('commitment')
-        
-        # Preference-related
-        if any(word in message_lower for word in ['prefer', 'like', 'want', 'need']):
-            intents.append('preference')
-        
-        # Personal info
-        if any(word in message_lower for word in ['who', 'where', 'what about']):
-            intents.append('fact')
-            intents.append('entity')
+        for _, matched in self._intent_automaton.iter(message.lower()):
+            for intent in matched:
+                if intent not in intents:
+                    intents.append(intent)
         
         if not intents:
             return []
         
-        return self.store.retrieve_relevant_memories(
+        return await self.store.aretrieve_relevant_memories(
             user_id=user_id,
             query=message,
             current_turn=current_turn,
             top_k=3,
-            memory_types=intents
+            memory_types=intents,
+            query_embedding=query_embedding
         )
     
     def _get_critical_memories(
@@ -140,20 +173,17 @@ class MemoryRetriever:
         } for m in critical]
     
     def _merge_memories(self, *memory_lists: List[Dict]) -> List[Dict]:
-        """Merge memory lists and remove duplicates."""
-        seen = set()
-        merged = []
+        """Merge memory lists and remove duplicates (first occurrence wins)."""
+        merged = {}
         
         for mem_list in memory_lists:
             for mem in mem_list:
                 mem_id = mem.get('vector_id') or mem.get('db_id')
-                if mem_id and mem_id not in seen:
-                    seen.add(mem_id)
-                    merged.append(mem)
+                if mem_id:
+                    merged.setdefault(mem_id, mem)
         
         # Sort by final score
-        merged.sort(key=lambda x: x.get('final_score', 0), reverse=True)
-        return merged[:settings.MEMORY_TOP_K + 2]  # Slightly more for safety
+        return sorted(merged.values(), key=_final_score, reverse=True)[:settings.MEMORY_TOP_K + 2]  # Slightly more for safety
     
     def _format_for_prompt(self, memories: List[Dict]) -> str:
         """Format memories for inclusion in LLM prompt."""
@@ -1,3 +1,6 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from app.config import settings
@@ -5,18 +8,66 @@ from app.models.user import User
 from app.models.chat import Conversation, Message
 from app.models.memory import Memory
 
+logger = logging.getLogger(__name__)
+
 client = None
 
 
+async def _migrate_user_indexes(database):
+    """
+    Prepare the users collection for the unique email index. Older
+    deployments have a non-unique email_1 on the same key, which MongoDB
+    won't keep next to a unique one, and may hold duplicate emails; the
+    oldest account per email is kept and the later ones are removed.
+    """
+    users = database[User.Settings.name]
+    indexes = await users.index_information()
+    if "email_unique" in indexes:
+        return
+
+    duplicates = users.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": "$email", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    async for group in duplicates:
+        extra_ids = group["ids"][1:]
+        logger.warning(
+            "Removing %d duplicate account(s) for %s: %s",
+            len(extra_ids), group["_id"], [str(user_id) for user_id in extra_ids]
+        )
+        await users.delete_many({"_id": {"$in": extra_ids}})
+
+    if "email_1" in indexes and not indexes["email_1"].get("unique"):
+        await users.drop_index("email_1")
+
+
 async def init_db():
     """Initialize MongoDB connection."""
     global client
 
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    # Motor runs each PyMongo call on the loop's default executor; size it for
+    # concurrent queries (asyncio.to_thread work shares the same pool)
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=settings.MONGO_EXECUTOR_WORKERS, thread_name_prefix="motor")
+    )
 
+    client = AsyncIOMotorClient(
+        settings.MONGODB_URL,
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+        # Memory/Message documents are text-heavy; compressors whose module
+        # is missing are skipped by PyMongo with a warning
+        compressors=settings.MONGO_COMPRESSORS,
+        uuidRepresentation="standard"
+    )
 
+    database = client.get_default_database()
+    await _migrate_user_indexes(database)
     await init_beanie(
-        database=client.get_default_database(),
+        database=database,
         document_models=[User, Conversation, Message, Memory]
     )
 
@@ -1,4 +1,10 @@
-from fastapi import FastAPI
+import logging
+import logging.handlers
+import queue
+
+import orjson
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
@@ -6,6 +12,17 @@ from app.config import settings
 from app.database import init_db, close_db
 from app.routers import auth, chat, memory, user
 
+# Application loggers (app.*) follow the DEBUG setting; libraries stay at INFO.
+# Records go through a queue so the actual stream writes happen on the
+# listener thread, never on the event loop.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler)
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])
+logging.getLogger("app").setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
+_log_listener.start()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -22,13 +39,16 @@ async def lifespan(app: FastAPI):
     # Shutdown
     await close_db()
     print("MongoDB connection closed")
+    _log_listener.stop()
 
 
 app = FastAPI(
     title="Long-Form Memory AI",
     description="Real-time long-form memory system for AI conversations",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson encodes the list endpoints' payloads (and datetimes) natively
+    default_response_class=ORJSONResponse,
 )
 
 # Parse CORS origins from config
@@ -50,24 +70,29 @@ app.include_router(memory.router, prefix="/memory", tags=["memory"])
 app.include_router(user.router, prefix="/user", tags=["user"])
 
 
+# Static bodies, encoded once: these routes are polled by load-balancer probes
+_ROOT_BODY = orjson.dumps({
+    "message": "Long-Form Memory AI API",
+    "version": "1.0.0",
+    "features": [
+        "User Authentication",
+        "Long-form Memory (1000+ turns)",
+        "RAG-based Retrieval",
+        "Real-time Streaming",
+        "MongoDB Database"
+    ]
+})
+_HEALTH_BODY = orjson.dumps({
+    "status": "healthy",
+    "database": "mongodb"
+})
+
+
 @app.get("/")
 async def root():
-    return {
-        "message": "Long-Form Memory AI API",
-        "version": "1.0.0",
-        "features": [
-            "User Authentication",
-            "Long-form Memory (1000+ turns)",
-            "RAG-based Retrieval",
-            "Real-time Streaming",
-            "MongoDB Database"
-        ]
-    }
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 
 @app.get("/health")
 async def health_check():
-    return {
-        "status": "healthy",
-        "database": "mongodb"
-    }
\ No newline at end of file
+    return Response(content=_HEALTH_BODY, media_type="application/json")
\ No newline at end of file
@@ -1,5 +1,5 @@
 from app.models.user import User
-from app.models.chat import Conversation, Message
-from app.models.memory import Memory
+from app.models.chat import Conversation, ConversationView, Message, MessageTurn, MessageView
+from app.models.memory import Memory, MemoryView
 
-__all__ = ["User", "Conversation", "Message", "Memory"]
\ No newline at end of file
+__all__ = ["User", "Conversation", "ConversationView", "Message", "MessageTurn", "MessageView", "Memory", "MemoryView"]
\ No newline at end of file
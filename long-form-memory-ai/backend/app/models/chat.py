@@ -1,5 +1,5 @@
-from beanie import Document
-from pydantic import Field
+from beanie import Document, PydanticObjectId
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, model_validator
 from datetime import datetime
 from typing import Optional, List
 
@@ -15,10 +15,41 @@ class Conversation(Document):
 
     class Settings:
         name = "conversations"
+        indexes = [
+            # Conversation list: newest first per user
+            [("user_id", 1), ("created_at", -1)],
+            [("user_id", 1), ("updated_at", -1)],
+        ]
+
+
+class ConversationView(BaseModel):
+    """
+    Conversation fields returned to the client.
+    Built from a Conversation document, or used as a find() projection (raw "_id").
+    """
+    model_config = ConfigDict(from_attributes=True)
+
+    id: PydanticObjectId = Field(validation_alias=AliasChoices("_id", "id"))
+    title: str
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    turn_count: int = 0
+
+    @model_validator(mode="after")
+    def _default_updated_at(self):
+        # Never-updated conversations report their creation time
+        if self.updated_at is None:
+            self.updated_at = self.created_at
+        return self
+
+
+# History reads: ordered by turn within a conversation (also passed as a query hint)
+MESSAGE_HISTORY_INDEX = [("conversation_id", 1), ("turn_number", 1), ("created_at", 1)]
 
 
 class Message(Document):
     conversation_id: str
+    user_id: Optional[str] = None  # Owner, denormalized for per-user deletes
     turn_number: int
     role: str  # 'user' or 'assistant'
     content: str
@@ -30,3 +61,23 @@ class Message(Document):
 
     class Settings:
         name = "messages"
+        indexes = [
+            [("user_id", 1)],
+            MESSAGE_HISTORY_INDEX,
+        ]
+
+
+class MessageView(BaseModel):
+    """Projection of the Message fields returned by the history endpoint."""
+    id: PydanticObjectId = Field(alias="_id")
+    role: str
+    content: str
+    turn_number: int
+    created_at: datetime
+
+
+class MessageTurn(BaseModel):
+    """Projection of a Message down to what the LLM context needs."""
+    role: str
+    content: str
+    turn_number: int
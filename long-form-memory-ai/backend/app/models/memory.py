@@ -1,9 +1,15 @@
-from beanie import Document, Indexed
+from beanie import Document, Indexed, PydanticObjectId
+from pydantic import BaseModel, Field
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from pymongo import IndexModel, ASCENDING, DESCENDING
 
 
+def format_memory_line(key: str, value: str) -> str:
+    """The memory's bullet line in the LLM memory context; stored as Memory.formatted_line."""
+    return f"  • {key}: {value}"
+
+
 class Memory(Document):
     user_id: str
     memory_type: str  # 'preference', 'fact', 'entity', 'commitment', 'instruction'
@@ -17,10 +23,12 @@ class Memory(Document):
     is_active: bool = True
     access_count: int = 0
     last_accessed_turn: int = 0
-    created_at: datetime = datetime.utcnow()
+    created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
     expires_at: Optional[datetime] = None
     vector_id: str = ""
+    # Pre-rendered context line, written with key/value so formatting is not redone every turn
+    formatted_line: str = ""
     
     class Settings:
         name = "memories"
@@ -42,4 +50,20 @@ class Memory(Document):
                 [("user_id", ASCENDING), ("is_active", ASCENDING), ("memory_type", ASCENDING), ("source_turn", DESCENDING)],
                 name="user_type_turn_idx"
             ),
-        ]
\ No newline at end of file
+        ]
+
+
+class MemoryView(BaseModel):
+    """
+    Projection of the Memory fields returned by the memory list endpoint.
+    Serialization aliases keep the response keys (id, type, importance) the frontend reads.
+    """
+    id: PydanticObjectId = Field(alias="_id", serialization_alias="id")
+    memory_type: str = Field(serialization_alias="type")
+    key: str
+    value: str
+    confidence: float
+    importance_score: float = Field(serialization_alias="importance")
+    source_turn: int
+    access_count: int
+    created_at: datetime
\ No newline at end of file
@@ -1,5 +1,6 @@
 from beanie import Document
-from pydantic import EmailStr
+from pydantic import EmailStr, Field
+from pymongo import IndexModel, ASCENDING
 from datetime import datetime
 from typing import Optional, List
 
@@ -9,7 +10,7 @@ class User(Document):
     username: str
     hashed_password: Optional[str] = None  # Optional for OAuth users
     is_active: bool = True
-    created_at: datetime = datetime.utcnow()
+    created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
     
     # Firebase/Google authentication fields
@@ -22,10 +23,15 @@ class User(Document):
     class Settings:
         name = "users"
         indexes = [
-            # Email uniqueness (for traditional auth)
-            [("email", 1)],  # Unique index on email
-            # Firebase UID uniqueness (for OAuth)
-            [("firebase_uid", 1)],  # Unique index on firebase_uid
+            # Email uniqueness, enforced by the server so concurrent registrations
+            # cannot both succeed (replaces the old non-unique email_1, see
+            # database._migrate_user_indexes)
+            IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+            # Username lookups (register duplicate check); Google display names
+            # are not unique, so neither are usernames
+            [("username", 1)],
+            # Firebase UID lookups (for OAuth)
+            [("firebase_uid", 1)],
             # Auth provider index
             [("auth_provider", 1)],
             # Combined indexes for common queries
@@ -1,20 +1,23 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
-from datetime import timedelta, datetime
 from typing import Optional
+from beanie import PydanticObjectId
+from pymongo.errors import DuplicateKeyError
 
 from app.models.user import User
 from app.services.auth_service import (
     authenticate_user,
     create_access_token,
-    get_password_hash,
-    get_current_user
+    aget_password_hash,
+    get_current_user,
+    get_current_user_cached,
+    register_login_attempt,
+    reset_login_attempts
 )
-from app.config import settings
 from app.services.firebase_service import firebase_service
-from fastapi import HTTPException
 
 router = APIRouter(tags=["authentication"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
@@ -38,6 +41,12 @@ class GoogleAuthRequest(BaseModel):
     user_info: dict
 
 
+class ExistingUserView(BaseModel):
+    """Projection used by the register duplicate check."""
+    email: str
+    username: str
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -45,25 +54,41 @@ class Token(BaseModel):
     user: UserResponse
 
 
+def _raise_duplicate(field: str):
+    if field == "email":
+        raise HTTPException(status_code=400, detail="Email already registered")
+    raise HTTPException(status_code=400, detail="Username already taken")
+
+
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 async def register(user_data: UserCreate):
-    if await User.find_one(User.email == user_data.email):
-        raise HTTPException(status_code=400, detail="Email already registered")
+    # Cheap indexed check first, so taken emails/usernames don't cost a KDF run
+    identity = {"$or": [{"email": user_data.email}, {"username": user_data.username}]}
+    existing = await User.find_one(identity, projection_model=ExistingUserView)
+    if existing:
+        _raise_duplicate("email" if existing.email == user_data.email else "username")
 
-    if await User.find_one(User.username == user_data.username):
-        raise HTTPException(status_code=400, detail="Username already taken")
+    # Argon2 is CPU-bound: hash in a worker thread so the event loop keeps serving
+    hashed_password = await aget_password_hash(user_data.password)
 
+    # The id is assigned client-side so the token can be signed while the write is in flight
     user = User(
+        id=PydanticObjectId(),
         email=user_data.email,
         username=user_data.username,
-        hashed_password=get_password_hash(user_data.password)
+        hashed_password=hashed_password
     )
-    await user.insert()
+    document = user.model_dump(exclude={"id", "revision_id"})
+    document["_id"] = user.id
 
-    access_token = create_access_token(
-        data={"sub": str(user.id)},
-        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
+    # The unique email index rejects a registration that raced past the check
+    try:
+        _, access_token = await asyncio.gather(
+            User.get_motor_collection().insert_one(document),
+            asyncio.to_thread(create_access_token, {"sub": str(user.id)}),
+        )
+    except DuplicateKeyError:
+        _raise_duplicate("email")
 
     return {
         "access_token": access_token,
@@ -77,7 +102,15 @@ async def register(user_data: UserCreate):
 
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    client_ip = request.client.host if request.client else "unknown"
+    # Reject bursts before paying for bcrypt
+    if not await register_login_attempt(form_data.username, client_ip):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later"
+        )
+
     user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
@@ -86,10 +119,9 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = create_access_token(
-        data={"sub": str(user.id)},
-        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
+    await reset_login_attempts(form_data.username, client_ip)
+
+    access_token = create_access_token(data={"sub": str(user.id)})
 
     return {
         "access_token": access_token,
@@ -127,10 +159,7 @@ async def login_with_google(google_data: GoogleAuthRequest):
         )
         
         # Create access token
-        access_token = create_access_token(
-            data={"sub": str(user.id)},
-            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        )
+        access_token = create_access_token(data={"sub": str(user.id)})
         
         return {
             "access_token": access_token,
@@ -155,4 +184,4 @@ async def login_with_google(google_data: GoogleAuthRequest):
 async def get_current_user_dependency(
     token: str = Depends(oauth2_scheme),
 ) -> User:
-    return await get_current_user(token)
\ No newline at end of file
+    return await get_current_user_cached(token)
\ No newline at end of file
@@ -2,9 +2,10 @@ from fastapi import APIRouter, Depends
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, AsyncGenerator
-import json
+import orjson
 
 from app.models.user import User
+from app.models.chat import ConversationView
 from app.routers.auth import get_current_user_dependency
 from app.services.chat_service import ChatService
 
@@ -12,6 +13,15 @@ router = APIRouter(tags=["chat"])
 
 chat_service = ChatService()
 
+# Server-sent event framing, pre-encoded
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_SSE_DONE = b"data: [DONE]\n\n"
+
+
+def _encode_event(event: dict) -> bytes:
+    return _SSE_PREFIX + orjson.dumps(event) + _SSE_SUFFIX
+
 
 class MessageCreate(BaseModel):
     content: str
@@ -44,17 +54,7 @@ async def create_conversation(
         title=data.title
     )
 
-    return {
-        "id": str(conv.id),
-        "title": conv.title,
-        "created_at": conv.created_at.isoformat(),
-        "updated_at": (
-            conv.updated_at.isoformat()
-            if conv.updated_at
-            else conv.created_at.isoformat()
-        ),
-        "turn_count": conv.turn_count
-    }
+    return ConversationView.model_validate(conv)
 
 
 @router.get("/conversations/{conversation_id}/messages")
@@ -83,16 +83,16 @@ async def send_message(
 
     if data.stream:
 
-        async def event_gen() -> AsyncGenerator[str, None]:
+        async def event_gen() -> AsyncGenerator[bytes, None]:
             async for event in chat_service.process_message(
                 user_id=str(current_user.id),
                 conversation_id=data.conversation_id,
                 content=data.content,
                 stream=True
             ):
-                yield f"data: {json.dumps(event)}\n\n"
+                yield _encode_event(event)
 
-            yield "data: [DONE]\n\n"
+            yield _SSE_DONE
 
         return StreamingResponse(event_gen(), media_type="text/event-stream")
 
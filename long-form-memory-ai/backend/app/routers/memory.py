@@ -1,57 +1,59 @@
 
 from fastapi import APIRouter, Depends, Body
 from typing import Optional
+from datetime import datetime
+from functools import lru_cache
 
 from app.models.user import User
-from app.models.memory import Memory
+from app.models.memory import Memory, MemoryView
 from app.routers.auth import get_current_user_dependency
 from app.utils.memory_tester import MemoryTester
 from app.core.memory_extractor import MemoryExtractor
+from app.services.memory_service import MemoryService
 
 router = APIRouter(tags=["memory"])
 
 
+@lru_cache(maxsize=1)
+def get_memory_service() -> MemoryService:
+    return MemoryService()
+
+
+@lru_cache(maxsize=1)
+def get_memory_extractor() -> MemoryExtractor:
+    return MemoryExtractor()
+
+
+@lru_cache(maxsize=1)
+def get_memory_tester() -> MemoryTester:
+    return MemoryTester()
+
+
 @router.get("/")
 async def get_memories(
     memory_type: Optional[str] = None,
     current_user: User = Depends(get_current_user_dependency),
 ):
-    query = Memory.find(
-        Memory.user_id == str(current_user.id),
-        Memory.is_active == True
-    )
-
+    # Plain filter dict: skips building Beanie field expressions per request
+    filters = {"user_id": str(current_user.id), "is_active": True}
     if memory_type:
-        query = query.find(Memory.memory_type == memory_type)
-
-    memories = await query.to_list()
-
-    return [
-        {
-            "id": str(m.id),
-            "type": m.memory_type,
-            "key": m.key,
-            "value": m.value,
-            "confidence": m.confidence,
-            "importance": m.importance_score,
-            "source_turn": m.source_turn,
-            "access_count": m.access_count,
-            "created_at": m.created_at.isoformat()
-        }
-        for m in memories
-    ]
+        filters["memory_type"] = memory_type
+
+    # Served by the (user_id, is_active[, memory_type], ...) indexes; fetch only rendered fields
+    # Serialized in one pass by FastAPI using MemoryView's serialization aliases
+    return await Memory.find(filters).project(MemoryView).to_list()
 
 
 @router.post("/test")
 async def test_memory_system(
     current_user: User = Depends(get_current_user_dependency),
+    tester: MemoryTester = Depends(get_memory_tester),
 ):
     """
     Test the memory system to ensure it's working correctly.
     Creates test memories and verifies time-based retrieval.
     """
     try:
-        tester = MemoryTester()
         results = await tester.run_full_test_suite(str(current_user.id))
         return {
             "success": True,
@@ -71,16 +73,13 @@ async def debug_memory_retrieval(
     hours_ago: Optional[int] = None,
     memory_type: Optional[str] = None,
     current_user: User = Depends(get_current_user_dependency),
+    memory_service: MemoryService = Depends(get_memory_service),
 ):
     """
     Debug endpoint to inspect what memories are being retrieved.
     Useful for troubleshooting memory issues.
     """
     try:
-        from app.services.memory_service import MemoryService
-        from datetime import datetime
-        
-        memory_service = MemoryService()
         user_id = str(current_user.id)
         
         # Get different sets of memories
@@ -111,7 +110,7 @@ async def debug_memory_retrieval(
                 "importance": mem.importance_score,
                 "confidence": mem.confidence,
                 "access_count": mem.access_count,
-                "created_at": mem.created_at.isoformat()
+                "created_at": mem.created_at
             }
         
         return {
@@ -139,14 +138,13 @@ async def test_memory_extraction(
     message: str = Body(..., embed=True),
     turn_number: int = Body(1, embed=True),
     current_user: User = Depends(get_current_user_dependency),
+    extractor: MemoryExtractor = Depends(get_memory_extractor),
 ):
     """
     Test memory extraction on a specific message to see what would be extracted.
     Useful for understanding why memories are/aren't being stored.
     """
     try:
-        extractor = MemoryExtractor()
-        
         # Test extraction decision
         decision = extractor.should_extract(turn_number, message)
         
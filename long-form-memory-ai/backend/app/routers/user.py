@@ -1,20 +1,32 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.models.user import User
 from app.models.memory import Memory
 from app.models.chat import Conversation, Message
 from app.routers.auth import get_current_user_dependency
+from app.services.auth_service import invalidate_cached_tokens, invalidate_cached_user
 
 router = APIRouter(prefix="/user", tags=["user"])
 
+
 @router.delete("/delete", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_account(current_user: User = Depends(get_current_user_dependency)):
     user_id = str(current_user.id)
-    # Delete all memories
-    await Memory.find(Memory.user_id == user_id).delete()
-    # Delete all conversations
-    await Conversation.find(Conversation.user_id == user_id).delete()
-    # Delete all messages in those conversations
-    await Message.find({"conversation_id": {"$in": [c.id async for c in Conversation.find(Conversation.user_id == user_id)]}}).delete()
-    # Delete user
-    await current_user.delete()
+    # Messages saved before Message.user_id existed are found via their conversation
+    conversation_ids = await Conversation.get_motor_collection().distinct(
+        "_id", {"user_id": user_id}
+    )
+    # Delete memories, messages, conversations and the user concurrently,
+    # straight on the collections to skip Beanie's document layer
+    await asyncio.gather(
+        Memory.get_motor_collection().delete_many({"user_id": user_id}),
+        Message.get_motor_collection().delete_many({"$or": [
+            {"user_id": user_id},
+            {"conversation_id": {"$in": [str(cid) for cid in conversation_ids]}},
+        ]}),
+        Conversation.get_motor_collection().delete_many({"user_id": user_id}),
+        current_user.delete(),
+    )
+    invalidate_cached_tokens(user_id)
+    await invalidate_cached_user(user_id)
     return None
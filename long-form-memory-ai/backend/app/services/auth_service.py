@@ -1,7 +1,15 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
-from jose import JWTError, jwt
+import bcrypt
+import xxhash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
+from cachetools import TTLCache
+from jose import JWTError, jwk, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
 
@@ -9,72 +17,314 @@ from app.config import settings
 from app.models.user import User
 from bson import ObjectId
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    aioredis = None
 
+_redis_client = None
+_redis_disabled = False
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+# In-process user cache in front of Redis/MongoDB, keyed by user id.
+# Only touched from the event loop with no await in between, so it needs no lock.
+_user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=settings.USER_LOCAL_CACHE_TTL_SECONDS)
+
+# New hashes are Argon2id (argon2-cffi); bcrypt hashes from before the switch are
+# verified with the bcrypt binding and upgraded on login. Hashes made with other
+# parameters are upgraded the same way (see password_needs_rehash).
+_argon2 = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST_KIB,
+    parallelism=settings.ARGON2_PARALLELISM,
+)
+_ARGON2_PREFIX = "$argon2"
+_BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+# Only used for stored hashes in neither format above
+pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated=["bcrypt"])
+
+# Password hashing gets its own small pool so login bursts cannot starve the
+# default executor Motor runs its queries on, and so at most PASSWORD_HASH_WORKERS
+# Argon2 buffers are allocated at once however many (dummy) verifies are queued
+_PASSWORD_POOL = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+
+# Parse SECRET_KEY into a jose key once; jwt.encode/decode otherwise rebuild it
+# (and for RS*/ES* re-load the PEM) on every call
+_jwt_key = jwk.construct(settings.SECRET_KEY, settings.ALGORITHM)
+# HS* verifies with the shared secret; RS*/ES* verify with the derived public key
+_jwt_verify_key = (
+    _jwt_key if settings.ALGORITHM.startswith("HS") else _jwt_key.public_key()
+)
+
+
+def _bcrypt_truncate(password: str) -> str:
     # Truncate to 72 bytes for bcrypt compatibility
-    truncated_password = plain_password.encode('utf-8')[:72].decode('utf-8', errors='ignore')
-    return pwd_context.verify(truncated_password, hashed_password)
+    return password.encode('utf-8')[:72].decode('utf-8', errors='ignore')
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    if hashed_password.startswith(_ARGON2_PREFIX):
+        try:
+            return _argon2.verify(hashed_password, plain_password)
+        except (VerifyMismatchError, InvalidHashError):
+            return False
+    truncated_password = _bcrypt_truncate(plain_password)
+    try:
+        if hashed_password.startswith(_BCRYPT_PREFIXES):
+            return bcrypt.checkpw(truncated_password.encode('utf-8'), hashed_password.encode('utf-8'))
+        # Any other legacy format still goes through passlib
+        return pwd_context.verify(truncated_password, hashed_password)
+    except ValueError:
+        # Malformed or unrecognized stored hash
+        return False
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True for pre-Argon2id hashes, or Argon2 hashes made with outdated parameters."""
+    if not hashed_password.startswith(_ARGON2_PREFIX):
+        return True
+    try:
+        return _argon2.check_needs_rehash(hashed_password)
+    except InvalidHashError:
+        return True
 
 
 def get_password_hash(password: str) -> str:
-    # Truncate to 72 bytes for bcrypt compatibility
-    truncated_password = password.encode('utf-8')[:72].decode('utf-8', errors='ignore')
-    return pwd_context.hash(truncated_password)
+    # Argon2 has no input length limit, so the full password is hashed
+    return _argon2.hash(password)
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the password pool, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_PASSWORD_POOL, verify_password, plain_password, hashed_password)
+
+
+async def aget_password_hash(password: str) -> str:
+    """get_password_hash on the password pool, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_PASSWORD_POOL, get_password_hash, password)
+
+
+# Verified against when the email is unknown, so a miss costs the same KDF work as a hit
+_DUMMY_PASSWORD_HASH = get_password_hash("dummy-password-for-timing")
+
+
+_DEFAULT_TOKEN_DELTA = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
 
 
 def create_access_token(
     data: dict,
     expires_delta: Optional[timedelta] = None
 ) -> str:
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (
-        expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    expire = datetime.utcnow() + (expires_delta or _DEFAULT_TOKEN_DELTA)
+    # One claims dict; jose converts "exp" in place, so nothing else is copied
+    return jwt.encode({**data, "exp": expire}, _jwt_key, algorithm=settings.ALGORITHM)
+
+
+# Verified token payloads, so a session's repeated requests skip signature checks.
+# Keyed by xxh3 of the token; the token itself is stored and compared on hit.
+_token_cache: TTLCache = TTLCache(
+    maxsize=100_000, ttl=min(60, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+)
 
 
 def decode_token(token: str) -> Optional[dict]:
+    key = xxhash.xxh3_64_intdigest(token)
+    cached = _token_cache.get(key)
+    if cached is not None and cached[0] == token:
+        payload = cached[1]
+        exp = payload.get("exp")
+        if exp is None or exp > time.time():
+            return payload
+        _token_cache.pop(key, None)
+        return None
+
     try:
-        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = jwt.decode(token, _jwt_verify_key, algorithms=[settings.ALGORITHM])
     except JWTError:
         return None
+    _token_cache[key] = (token, payload)
+    return payload
 
 
-async def get_current_user(token: str) -> User:
-    credentials_exception = HTTPException(
+def invalidate_cached_tokens(user_id: str) -> None:
+    """Forget every verified token of a user (call when the account goes away)."""
+    stale = [key for key, (_, payload) in list(_token_cache.items()) if payload.get("sub") == user_id]
+    for key in stale:
+        _token_cache.pop(key, None)
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    payload = decode_token(token)
-    if not payload:
-        raise credentials_exception
 
-    user_id = payload.get("sub")
+def _token_user_id(token: str) -> str:
+    payload = decode_token(token)
+    user_id = payload.get("sub") if payload else None
     if not user_id:
-        raise credentials_exception
+        raise _credentials_exception()
+    return user_id
+
+
+async def _fetch_user(user_id: str) -> User:
+    """Resolve an active user by id, through the in-process cache."""
+    user = _user_cache.get(user_id)
+    if user is None:
+        try:
+            user = await User.get(ObjectId(user_id))
+        except Exception:
+            raise _credentials_exception()
+        if user is None:
+            raise _credentials_exception()
+        _user_cache[user_id] = user
+
+    if not user.is_active:
+        raise _credentials_exception()
+    return user
+
+
+async def get_current_user(token: str) -> User:
+    return await _fetch_user(_token_user_id(token))
+
+
+def get_redis():
+    """Return the shared Redis client, or None when Redis is unavailable or misconfigured."""
+    global _redis_client, _redis_disabled
+    if _redis_client is None and not _redis_disabled:
+        if not REDIS_AVAILABLE or not settings.REDIS_URL:
+            _redis_disabled = True
+            return None
+        try:
+            _redis_client = aioredis.from_url(
+                settings.REDIS_URL,
+                socket_connect_timeout=0.1,
+                socket_timeout=0.1
+            )
+        except Exception as e:
+            print(f"Redis disabled: {e}")
+            _redis_disabled = True
+    return _redis_client
+
+
+def _user_cache_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+async def get_current_user_cached(token: str) -> User:
+    """
+    get_current_user with a Redis cache-aside on the token's user id,
+    behind the in-process cache. The JWT signature is verified once and the
+    payload reused for up to a minute (see decode_token); expiry is still
+    checked on every call. Falls back to MongoDB whenever Redis is unavailable.
+    """
+    user_id = _token_user_id(token)
+
+    user = _user_cache.get(user_id)
+    if user is not None and user.is_active:
+        return user
+
+    client = get_redis()
+    if client is not None:
+        try:
+            cached = await client.get(_user_cache_key(user_id))
+            if cached:
+                user = User.model_validate_json(cached)
+                if user.is_active:
+                    _user_cache[user_id] = user
+                    return user
+        except Exception:
+            pass
 
+    user = await _fetch_user(user_id)
+
+    if client is not None:
+        try:
+            await client.setex(
+                _user_cache_key(str(user.id)),
+                settings.USER_CACHE_TTL_SECONDS,
+                # Never put password hashes in Redis; cached users must not be save()d
+                user.model_dump_json(exclude={"hashed_password"})
+            )
+        except Exception:
+            pass
+
+    return user
+
+
+async def invalidate_cached_user(user_id: str) -> None:
+    """Drop a user's cached document (call after deleting, deactivating or updating them)."""
+    _user_cache.pop(user_id, None)
+    client = get_redis()
+    if client is None:
+        return
     try:
-        user = await User.get(ObjectId(user_id))
+        await client.delete(_user_cache_key(user_id))
     except Exception:
-        raise credentials_exception
+        pass
 
-    if not user or not user.is_active:
-        raise credentials_exception
 
-    return user
+def _login_attempts_key(email: str, client_ip: str) -> str:
+    return f"login_attempts:{email}:{client_ip}"
+
+
+async def register_login_attempt(email: str, client_ip: str) -> bool:
+    """
+    Count a login attempt for this email+IP; False once the window's limit is exceeded.
+    Always allows the attempt when Redis is unavailable.
+    """
+    client = get_redis()
+    if client is None:
+        return True
+    key = _login_attempts_key(email, client_ip)
+    try:
+        # The window's TTL is set when the counter is created, in the same
+        # MULTI as the increment, so a counter can never be left without one
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.set(key, 0, ex=settings.LOGIN_ATTEMPT_WINDOW_SECONDS, nx=True)
+            pipe.incr(key)
+            _, attempts = await pipe.execute()
+    except Exception:
+        return True
+    return attempts <= settings.LOGIN_MAX_ATTEMPTS
+
+
+async def reset_login_attempts(email: str, client_ip: str) -> None:
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        await client.delete(_login_attempts_key(email, client_ip))
+    except Exception:
+        pass
 
 
 async def authenticate_user(email: str, password: str) -> Optional[User]:
     user = await User.find_one(User.email == email)
-    if not user:
+    if not user or not user.hashed_password:
+        # Unknown emails and password-less (OAuth) accounts still pay one password
+        # verify, so they are indistinguishable from a wrong password by timing
+        await averify_password(password, _DUMMY_PASSWORD_HASH)
         return None
 
-    if not verify_password(password, user.hashed_password):
+    # Password verify is CPU-bound: run it off the event loop
+    if not await averify_password(password, user.hashed_password):
         return None
 
+    # The plaintext is only available now: upgrade bcrypt hashes to Argon2id
+    if password_needs_rehash(user.hashed_password):
+        user.hashed_password = await aget_password_hash(password)
+        await User.get_motor_collection().update_one(
+            {"_id": user.id}, {"$set": {"hashed_password": user.hashed_password}}
+        )
+        await invalidate_cached_user(str(user.id))
+
     return user
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""
+Per-turn formatting loops used by ChatService.
+
+Kept free of app imports so the module can be compiled as-is with Cython
+(`cythonize -i app/services/chat_fastpath.py`); the built extension then
+shadows this file on import. Without it, this pure-Python version is used.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, List
+
+# Memory context framing, shared by every turn
+_MEMORY_CONTEXT_HEADER = "You have access to the following information from previous conversations with this user:\n"
+_MEMORY_CONTEXT_FOOTER = (
+    "IMPORTANT: Use the most recent preferences. If preferences conflict, the user's latest stated preference takes priority.\n"
+    "Use this information naturally when relevant. Don't mention you have this context unless asked."
+)
+# Preferences first (most recent), then facts, etc.
+_MEMORY_PRIORITY_ORDER = ['preference', 'instruction', 'fact', 'entity', 'commitment', 'constraint']
+_MEMORY_PRIORITY_INDEX = {mem_type: i for i, mem_type in enumerate(_MEMORY_PRIORITY_ORDER)}
+_MEMORY_SECTION_HEADERS = {mem_type: f"**{mem_type.upper()}S:**" for mem_type in _MEMORY_PRIORITY_ORDER}
+_RECENT_MEMORY_HEADER = "Recently shared by this user (newest first; these take priority over anything above):\n"
+
+
+def format_memories(memories: List[Any]) -> str:
+    """
+    Format memories for injection into LLM context.
+    Prioritizes recent preferences and facts.
+    """
+    if not memories:
+        return ""
+
+    # Group memories by type for better organization
+    grouped: Dict[str, List[str]] = defaultdict(list)
+    for mem in memories:
+        # formatted_line is rendered at write time; older documents predate it
+        grouped[mem.memory_type].append(mem.formatted_line or f"  • {mem.key}: {mem.value}")
+
+    # Known types in priority order; the sort is stable, so other types follow in first-seen order
+    other_index = len(_MEMORY_PRIORITY_INDEX)
+    sections = [_MEMORY_CONTEXT_HEADER]
+    for mem_type in sorted(grouped, key=lambda t: _MEMORY_PRIORITY_INDEX.get(t, other_index)):
+        header = _MEMORY_SECTION_HEADERS.get(mem_type) or f"**{mem_type.upper()}:**"
+        sections.append(header + "\n" + "\n".join(grouped[mem_type]) + "\n")
+    sections.append(_MEMORY_CONTEXT_FOOTER)
+    return "\n".join(sections)
+
+
+def format_recent_memories(memories: List[Any]) -> str:
+    """Format the volatile block of memories learned in the last few hours, newest first."""
+    if not memories:
+        return ""
+    return _RECENT_MEMORY_HEADER + "\n".join(
+        f"{mem.formatted_line or f'  • {mem.key}: {mem.value}'} ({mem.memory_type})" for mem in memories
+    )
+
+
+def project_messages(messages: List[Any]) -> List[Dict[str, Any]]:
+    """Render history messages as the response dicts of the messages endpoint."""
+    return [
+        {
+            "id": str(m.id),
+            "role": m.role,
+            "content": m.content,
+            "turn_number": m.turn_number,
+            "created_at": m.created_at,
+        }
+        for m in messages
+    ]
@@ -1,13 +1,76 @@
-from typing import List, Dict, Any, AsyncGenerator
-from datetime import datetime
+from typing import List, Dict, Any, AsyncGenerator, Set
+from datetime import datetime, timedelta
+from functools import lru_cache
+import asyncio
+import logging
 import re
+import time
+from beanie import PydanticObjectId
 from fastapi import HTTPException
-from app.models.chat import Conversation, Message
+from pymongo import ReturnDocument, UpdateOne
+from app.config import settings
+from app.models.chat import (
+    MESSAGE_HISTORY_INDEX,
+    Conversation,
+    ConversationView,
+    Message,
+    MessageTurn,
+    MessageView,
+)
 from app.services.llm_service import LLMService
 from app.services.memory_service import MemoryService
+from app.services.chat_fastpath import format_memories, format_recent_memories, project_messages
 from app.core.memory_extractor import MemoryExtractor
 from app.core.memory_reasoner import MemoryReasoner
 
+logger = logging.getLogger(__name__)
+
+_SYSTEM_CONTEXT_TEMPLATE = (
+    "You are a helpful assistant with long-term memory. "
+    "Use stored memories and logical inference to answer personal questions when possible. "
+    "If a preference implies a specific choice, infer it using common knowledge. "
+    "If uncertain, ask a brief clarifying question instead of guessing.\n\n"
+    "Current date/time: {date} {time} (ISO: {iso}). "
+    "Use this for questions like today/tomorrow/yesterday or current time."
+)
+
+
+@lru_cache(maxsize=4)
+def _system_context_for_minute(minute_epoch: int) -> str:
+    """System prompt for one wall-clock minute; byte-identical for every turn in it."""
+    now = datetime.fromtimestamp(minute_epoch * 60).astimezone()
+    return _SYSTEM_CONTEXT_TEMPLATE.format(
+        date=now.strftime("%A, %Y-%m-%d"),
+        time=now.strftime("%H:%M %Z"),
+        iso=now.isoformat(timespec="minutes"),
+    )
+
+
+# Memories newer than this go in the per-turn volatile block instead of the stable profile
+_VOLATILE_MEMORY_WINDOW = timedelta(hours=4)
+
+# Keyword fallback for critical turns whose LLM extraction failed. Each type's
+# alternatives are one compiled regex; every alternative has a single group.
+_EMERGENCY_PATTERNS = tuple(
+    (memory_type, re.compile("|".join(patterns), re.IGNORECASE))
+    for memory_type, patterns in (
+        ("name", (r"my name is (\w+)", r"call me (\w+)", r"i'm (\w+)", r"i am (\w+)")),
+        ("location", (r"i live in ([\w\s]+)", r"from ([\w\s]+)", r"work at ([\w\s]+)")),
+        ("preference", (r"i like ([\w\s]+)", r"i love ([\w\s]+)", r"favorite ([\w\s]+)")),
+        ("age", (r"(\d+) years old", r"age (\d+)", r"(\d+)\s?years? old")),
+    )
+)
+
+# Post-turn tasks still running; holding a reference keeps them from being garbage collected
+_background_tasks: Set[asyncio.Task] = set()
+
+# Conversations whose formatted memory context is kept for reuse on the next turn
+_MEMORY_CONTEXT_CACHE_SIZE = 1024
+
+# Streamed tokens are coalesced into one chunk event per this many tokens or seconds
+_STREAM_FLUSH_TOKENS = 8
+_STREAM_FLUSH_INTERVAL = 0.03
+
 
 class ChatService:
     def __init__(self):
@@ -15,67 +78,43 @@ class ChatService:
         self.memory_service = MemoryService()
         self.memory_extractor = MemoryExtractor()
         self.memory_reasoner = MemoryReasoner()
+        # conversation_id -> (memory signature, formatted memory context)
+        self._memory_context_cache: Dict[str, tuple] = {}
 
     def _format_memories_for_context(self, memories: List[Any]) -> str:
         """
-        Format memories for injection into LLM context.
-        Prioritizes recent preferences and facts.
+        Format the stable user profile for injection into LLM context.
+
+        The prompt is sent as three blocks so providers can reuse the cached
+        prefix across turns: the static system prompt, this profile, and a
+        volatile block (memories from the last few hours plus any inference
+        hint) placed just before the latest user message. The profile is
+        ordered by (memory_type, key), not recency, so it only changes when
+        one of its memories does.
         """
-        if not memories:
-            return ""
-        
-        lines = ["You have access to the following information from previous conversations with this user:"]
-        lines.append("")
-        
-        # Group memories by type for better organization
-        grouped = {}
-        for mem in memories:
-            # All memories are now Memory objects
-            mem_type = mem.memory_type
-            key = mem.key
-            value = mem.value
-            
-            if mem_type not in grouped:
-                grouped[mem_type] = []
-            grouped[mem_type].append(f"{key}: {value}")
-        
-        # Format by priority: preferences first (most recent), then facts, etc.
-        priority_order = ['preference', 'instruction', 'fact', 'entity', 'commitment', 'constraint']
-        
-        for mem_type in priority_order:
-            if mem_type in grouped:
-                lines.append(f"**{mem_type.upper()}S:**")
-                for item in grouped[mem_type]:
-                    lines.append(f"  • {item}")
-                lines.append("")
-        
-        # Add any other types not in priority list
-        for mem_type, items in grouped.items():
-            if mem_type not in priority_order:
-                lines.append(f"**{mem_type.upper()}:**")
-                for item in items:
-                    lines.append(f"  • {item}")
-                lines.append("")
-        
-        lines.append("IMPORTANT: Use the most recent preferences. If preferences conflict, the user's latest stated preference takes priority.")
-        lines.append("Use this information naturally when relevant. Don't mention you have this context unless asked.")
-        
-        return "\n".join(lines)
+        return format_memories(sorted(memories, key=lambda mem: (mem.memory_type, mem.key)))
+
+    def _memory_context_for(self, conversation_id: str, memories: List[Any]) -> str:
+        """
+        Formatted memory context, reused while a conversation's selected memories
+        are unchanged. Memories are refetched every turn and updated_at moves on
+        every edit, so the signature also catches writes made by other workers.
+        """
+        signature = tuple((mem.id, mem.updated_at) for mem in memories)
+        cached = self._memory_context_cache.get(conversation_id)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        memory_context = self._format_memories_for_context(memories)
+        if conversation_id not in self._memory_context_cache and len(self._memory_context_cache) >= _MEMORY_CONTEXT_CACHE_SIZE:
+            # Evict the oldest conversation
+            self._memory_context_cache.pop(next(iter(self._memory_context_cache)))
+        self._memory_context_cache[conversation_id] = (signature, memory_context)
+        return memory_context
 
     def _build_system_context(self) -> str:
-        now = datetime.now().astimezone()
-        date_str = now.strftime("%A, %Y-%m-%d")
-        time_str = now.strftime("%H:%M:%S %Z")
-        iso_str = now.isoformat()
-
-        return (
-            "You are a helpful assistant with long-term memory. "
-            "Use stored memories and logical inference to answer personal questions when possible. "
-            "If a preference implies a specific choice, infer it using common knowledge. "
-            "If uncertain, ask a brief clarifying question instead of guessing.\n\n"
-            f"Current date/time: {date_str} {time_str} (ISO: {iso_str}). "
-            "Use this for questions like today/tomorrow/yesterday or current time."
-        )
+        # Minute precision keeps the prompt prefix stable, so provider-side prompt caching can hit
+        return _system_context_for_minute(int(time.time() // 60))
 
     def _derive_conversation_title(self, content: str, max_length: int = 60) -> str:
         """Create a compact, readable title from the first user message."""
@@ -182,47 +221,52 @@ class ChatService:
         self,
         user_id: str,
         limit: int = 50
-    ) -> List[Dict[str, Any]]:
+    ) -> List[ConversationView]:
         """Get all conversations for a user."""
-        conversations = (
-            await Conversation.find(Conversation.user_id == user_id)
-            .sort("-created_at")
-            .limit(limit)
-            .to_list()
-        )
+        # One aggregation: the (user_id, created_at desc) index drives the list, and
+        # conversations still on the default title pull in their first user message
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"created_at": -1}},
+            {"$limit": limit},
+            {"$lookup": {
+                "from": Message.get_motor_collection().name,
+                "let": {"cid": {"$toString": "$_id"}, "title": "$title"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$and": [
+                        {"$in": [{"$ifNull": ["$$title", ""]}, ["", "New Conversation"]]},
+                        {"$eq": ["$conversation_id", "$$cid"]},
+                        {"$eq": ["$role", "user"]},
+                    ]}}},
+                    {"$sort": {"turn_number": 1}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 0, "content": 1}},
+                ],
+                "as": "first_user_msg",
+            }},
+            {"$project": {
+                "title": 1, "created_at": 1, "updated_at": 1, "turn_count": 1, "first_user_msg": 1,
+            }},
+        ]
+        docs = await Conversation.get_motor_collection().aggregate(pipeline).to_list(length=limit)
 
         # Backfill title from first user message when conversation still has default title.
         # This keeps sidebar titles stable across refreshes, including older chats.
-        for conv in conversations:
-            if conv.title and conv.title != "New Conversation":
-                continue
-
-            first_user_messages = (
-                await Message.find(
-                    Message.conversation_id == str(conv.id),
-                    Message.role == "user"
-                )
-                .sort("+turn_number")
-                .limit(1)
-                .to_list()
-            )
-
-            if first_user_messages:
-                inferred_title = self._derive_conversation_title(first_user_messages[0].content)
+        conversations = []
+        title_updates = []
+        for doc in docs:
+            conv = ConversationView.model_validate(doc)
+            if doc["first_user_msg"]:
+                inferred_title = self._derive_conversation_title(doc["first_user_msg"][0]["content"])
                 if inferred_title != "New Conversation":
                     conv.title = inferred_title
-                    await conv.save()
-        
-        return [
-            {
-                "id": str(conv.id),
-                "title": conv.title,
-                "created_at": conv.created_at.isoformat(),
-                "updated_at": conv.updated_at.isoformat() if conv.updated_at else conv.created_at.isoformat(),
-                "turn_count": conv.turn_count
-            }
-            for conv in conversations
-        ]
+                    title_updates.append(UpdateOne({"_id": conv.id}, {"$set": {"title": inferred_title}}))
+            conversations.append(conv)
+
+        if title_updates:
+            await Conversation.get_motor_collection().bulk_write(title_updates, ordered=False)
+
+        return conversations
 
     async def get_conversation_history(
         self,
@@ -235,23 +279,16 @@ class ChatService:
         if not conv or conv.user_id != user_id:
             raise HTTPException(status_code=404, detail="Conversation not found")
 
+        # sort + limit walk the (conversation_id, turn_number, created_at) index
         messages = (
-            await Message.find(Message.conversation_id == conversation_id)
-            .sort("+created_at")
+            await Message.find(Message.conversation_id == conversation_id, hint=MESSAGE_HISTORY_INDEX)
+            .sort("+turn_number", "+created_at")
             .limit(limit)
+            .project(MessageView)
             .to_list()
         )
 
-        return [
-            {
-                "id": str(m.id),
-                "role": m.role,
-                "content": m.content,
-                "turn_number": m.turn_number,
-                "created_at": m.created_at.isoformat(),
-            }
-            for m in messages
-        ]
+        return project_messages(messages)
     
     async def delete_conversation(
         self,
@@ -275,13 +312,15 @@ class ChatService:
             user_id=user_id
         )
         
-        # 3. Delete all messages in the conversation
-        messages = await Message.find(Message.conversation_id == conversation_id).to_list()
-        for msg in messages:
-            await msg.delete()
+        # 3. Delete all messages in the conversation in one round-trip
+        result = await Message.get_motor_collection().delete_many({"conversation_id": conversation_id})
         
         # 4. Delete the conversation itself
         await conv.delete()
+        logger.info(
+            "Deleted conversation %s: %d messages, %d memories deactivated",
+            conversation_id, result.deleted_count, memories_deleted
+        )
         
         return True
 
@@ -294,80 +333,115 @@ class ChatService:
     ) -> AsyncGenerator[Dict[str, Any], None]:
 
 
-        conv = await Conversation.get(conversation_id)
-        if not conv or conv.user_id != user_id:
+        try:
+            conv_oid = PydanticObjectId(conversation_id)
+        except Exception:
             raise HTTPException(status_code=404, detail="Conversation not found")
 
-        # Use the first user message as conversation "crux" title.
-        if conv.turn_count == 0 and (not conv.title or conv.title == "New Conversation"):
-            conv.title = self._derive_conversation_title(content)
-
-        conv.turn_count += 1
-        conv.updated_at = datetime.utcnow()
-        await conv.save()
+        # Ownership check and turn counter bump in one atomic round-trip
+        raw_conv = await Conversation.get_motor_collection().find_one_and_update(
+            {"_id": conv_oid, "user_id": user_id},
+            {"$inc": {"turn_count": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not raw_conv:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        conv = Conversation.model_validate(raw_conv)
 
         # Save user message
         user_msg = Message(
             conversation_id=conversation_id,
+            user_id=user_id,
             turn_number=conv.turn_count,
             role="user",
             content=content
         )
-        await user_msg.insert()
-
-        # Build history
-        history = await Message.find(
-            Message.conversation_id == conversation_id
-        ).sort("+created_at").to_list()
 
-        messages = [
-            {"role": m.role, "content": m.content}
-            for m in history
-        ]
+        # Use the first user message as conversation "crux" title.
+        if conv.turn_count == 1 and (not conv.title or conv.title == "New Conversation"):
+            conv.title = self._derive_conversation_title(content)
+            await asyncio.gather(
+                user_msg.insert(),
+                Conversation.get_motor_collection().update_one(
+                    {"_id": conv_oid}, {"$set": {"title": conv.title}}
+                ),
+            )
+        else:
+            await user_msg.insert()
+
+        # Build history: a fixed window of the latest messages, read backwards
+        # along the history index. Started now so it overlaps memory retrieval.
+        history_task = asyncio.create_task(
+            Message.find(Message.conversation_id == conversation_id, hint=MESSAGE_HISTORY_INDEX)
+            .sort("-turn_number", "-created_at")
+            .limit(settings.CHAT_CONTEXT_TURNS)
+            .project(MessageTurn)
+            .to_list()
+        )
 
         # Retrieve relevant memories using BOTH semantic search AND recency
         # This ensures latest preferences are always considered
         
         # Enhanced memory retrieval with time-aware access
         
-        # 1. Get semantically relevant memories based on current message
-        relevant_memories = await self.memory_service.search_memories(
-            user_id=user_id,
-            query_text=content,
-            current_turn=conv.turn_count,
-            top_k=12  # Increased for better coverage
-        )
-        
-        # 2. Get memories from last 4 hours (addresses the core issue)
-        recent_hours_memories = await self.memory_service.get_user_memories(
-            user_id=user_id,
-            limit=15,
-            sort_by="time_created",
-            hours_ago=4  # NEW: Get memories from last 4 hours
-        )
-        
-        # 3. Get memories from last 24 hours for broader context
-        last_day_memories = await self.memory_service.get_user_memories(
-            user_id=user_id,
-            limit=10,
-            sort_by="time_created", 
-            hours_ago=24
-        )
-        
-        # 4. Get the most recent high-importance memories (preferences, instructions)
-        recent_important = await self.memory_service.get_user_memories(
-            user_id=user_id,
-            limit=8,
-            sort_by="recency"  # Hybrid sort for cross-conversation awareness
+        # The five lookups are independent: run them concurrently
+        retrievals = await asyncio.gather(
+            # 1. Get semantically relevant memories based on current message
+            self.memory_service.search_memories(
+                user_id=user_id,
+                query_text=content,
+                current_turn=conv.turn_count,
+                top_k=12  # Increased for better coverage
+            ),
+            # 2. Get memories from last 4 hours (addresses the core issue)
+            self.memory_service.get_user_memories(
+                user_id=user_id,
+                limit=15,
+                sort_by="time_created",
+                hours_ago=4  # NEW: Get memories from last 4 hours
+            ),
+            # 3. Get memories from last 24 hours for broader context
+            self.memory_service.get_user_memories(
+                user_id=user_id,
+                limit=10,
+                sort_by="time_created",
+                hours_ago=24
+            ),
+            # 4. Get the most recent high-importance memories (preferences, instructions)
+            self.memory_service.get_user_memories(
+                user_id=user_id,
+                limit=8,
+                sort_by="recency"  # Hybrid sort for cross-conversation awareness
+            ),
+            # 5. Always include a broader set of preferences for cross-chat inference
+            self.memory_service.get_user_memories(
+                user_id=user_id,
+                memory_type="preference",
+                limit=30,  # Reduced but still comprehensive
+                sort_by="time_created"  # Changed to time-based for better recall
+            ),
+            return_exceptions=True
         )
 
-        # 5. Always include a broader set of preferences for cross-chat inference
-        preference_memories = await self.memory_service.get_user_memories(
-            user_id=user_id,
-            memory_type="preference",
-            limit=30,  # Reduced but still comprehensive
-            sort_by="time_created"  # Changed to time-based for better recall
-        )
+        # A failed lookup only loses its own memories; the turn still goes ahead
+        for index, result in enumerate(retrievals):
+            if isinstance(result, BaseException):
+                logger.warning("Memory retrieval %d failed: %s", index + 1, result)
+        (
+            relevant_memories,
+            recent_hours_memories,
+            last_day_memories,
+            recent_important,
+            preference_memories,
+        ) = [[] if isinstance(result, BaseException) else result for result in retrievals]
+
+        history = await history_task
+        history.reverse()  # Back to chronological order
+
+        messages = [
+            {"role": m.role, "content": m.content}
+            for m in history
+        ]
         
         # 6. Enhanced merging and prioritization with time-aware deduplication
         memory_map = {}
@@ -439,43 +513,67 @@ class ChatService:
         system_context = self._build_system_context()
 
         # Format memories and inject into context if any exist
-        if memories:
-            memory_context = self._format_memories_for_context(memories)
-            if inference_hint:
-                memory_context += inference_hint
-            messages = [
+        # Stable profile up front, recent memories and the inference hint after the history
+        volatile_cutoff = datetime.utcnow() - _VOLATILE_MEMORY_WINDOW
+        stable_memories = [m for m in memories if m.created_at < volatile_cutoff]
+        recent_block = format_recent_memories([m for m in memories if m.created_at >= volatile_cutoff])
+        if inference_hint:
+            recent_block = (recent_block + inference_hint).lstrip()
+
+        if stable_memories:
+            messages[0:0] = (
                 {"role": "system", "content": system_context},
-                {"role": "system", "content": memory_context}
-            ] + messages
+                {"role": "system", "content": self._memory_context_for(conversation_id, stable_memories)}
+            )
         else:
-            messages = [
-                {"role": "system", "content": system_context}
-            ] + messages
+            messages.insert(0, {"role": "system", "content": system_context})
+        if recent_block:
+            # Ahead of the current user message, so the history prefix stays cacheable
+            messages.insert(len(messages) - 1, {"role": "system", "content": recent_block})
             
 
 
-        full_response = ""
+        response_parts = []
         llm_error = None
+        loop = asyncio.get_running_loop()
+        pending_chunks = []
+        last_flush = loop.time()
 
         async for event in self.llm_service.generate_response(
             messages=messages,
             stream=stream
         ):
+            if settings.CHAT_TRACE:
+                logger.debug("LLM event: %s", event)
 
             if event["type"] in ("token", "final"):
                 chunk = event.get("content", "")
-                full_response += chunk
+                response_parts.append(chunk)
 
                 if stream:
-                    yield {
-                        "type": "chunk",
-                        "content": chunk
-                    }
+                    # Coalesce tokens so each chunk event carries several of them
+                    pending_chunks.append(chunk)
+                    now = loop.time()
+                    if len(pending_chunks) >= _STREAM_FLUSH_TOKENS or now - last_flush >= _STREAM_FLUSH_INTERVAL:
+                        yield {
+                            "type": "chunk",
+                            "content": "".join(pending_chunks)
+                        }
+                        pending_chunks.clear()
+                        last_flush = now
 
             elif event["type"] == "error":
                 llm_error = event.get("content", "LLM generation failed")
                 break
 
+        if pending_chunks:
+            yield {
+                "type": "chunk",
+                "content": "".join(pending_chunks)
+            }
+
+        full_response = "".join(response_parts)
+
         if llm_error and not full_response.strip():
             full_response = (
                 "I ran into an issue while generating a response. "
@@ -485,6 +583,7 @@ class ChatService:
 
         assistant_msg = Message(
             conversation_id=conversation_id,
+            user_id=user_id,
             turn_number=conv.turn_count,
             role="assistant",
             content=full_response,
@@ -492,94 +591,19 @@ class ChatService:
         )
         await assistant_msg.insert()
 
-        # Update memory access statistics for the memories that were used
-        if active_memory_ids:
-            for memory_id in active_memory_ids:
-                await self.memory_service.refresh_memory_access(
-                    memory_id=memory_id,
-                    user_id=user_id,
-                    current_turn=conv.turn_count
-                )
-
-        # Enhanced memory extraction with reliability and fallbacks
-        extraction_decision = self.memory_extractor.should_extract(conv.turn_count, content)
-        
-        if extraction_decision["should_extract"]:
-            
-            try:
-                # First extraction attempt
-                extracted = await self.memory_extractor.extract_memories(
-                    user_message=content,
-                    assistant_response=full_response,
-                    turn_number=conv.turn_count,
-                    conversation_history=[{"role": m.role, "content": m.content} for m in history[-5:]],
-                    extraction_boost=extraction_decision.get("extraction_boost", 0.0)
-                )
-                
-                # Backup extraction if nothing was extracted but should have been
-                if not extracted and extraction_decision.get("priority") in ["critical", "high"]:
-                    backup_extracted = await self._backup_extraction(
-                        user_message=content,
-                        assistant_response=full_response,
-                        turn_number=conv.turn_count,
-                        priority=extraction_decision["priority"]
-                    )
-                    extracted.extend(backup_extracted)
-                
-                if extracted:
-                    extracted = self._dedupe_extracted_memories(extracted)
-                    memories_stored = 0
-                    existing_signatures = {
-                        (
-                            self._normalize_memory_text(mem.memory_type),
-                            self._normalize_memory_text(mem.value)
-                        )
-                        for mem in memories
-                    }
-                    
-                    for mem in extracted:
-                        try:
-                            # Apply importance boost based on extraction priority
-                            if extraction_decision.get("extraction_boost"):
-                                mem["importance"] = min(1.0, mem.get('importance', 0.5) + extraction_decision["extraction_boost"])
-
-                            signature = (
-                                self._normalize_memory_text(mem.get("type", "")),
-                                self._normalize_memory_text(mem.get("value", "")),
-                            )
-                            if signature in existing_signatures:
-                                continue
-                            
-                            
-                            # Store in database
-                            await self.memory_service.create_memory(
-                                user_id=user_id,
-                                memory_type=mem['type'],
-                                key=mem['key'],
-                                value=mem['value'],
-                                conversation_id=conversation_id,
-                                turn_number=conv.turn_count,
-                                confidence=mem.get('confidence', 0.5),
-                                importance=mem.get('importance', 0.5),
-                                context=f"From conversation turn {conv.turn_count} (priority: {extraction_decision['priority']})"
-                            )
-                            existing_signatures.add(signature)
-                            memories_stored += 1
-                            
-                        except Exception as mem_error:
-                            pass  # Memory storage failed, continue with others
-                else:
-                    pass  # No memories extracted
-                    
-            except Exception as e:
-                # Try emergency fallback extraction for critical cases
-                if extraction_decision.get("priority") == "critical":
-                    await self._emergency_memory_extraction(
-                        user_id=user_id,
-                        user_message=content,
-                        conversation_id=conversation_id,
-                        turn_number=conv.turn_count
-                    )
+        # Bookkeeping and extraction don't change the reply, so they run after it is sent
+        task = asyncio.create_task(self._post_turn_work(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            turn_number=conv.turn_count,
+            content=content,
+            full_response=full_response,
+            active_memory_ids=active_memory_ids,
+            memories=memories,
+            history=history[-5:],
+        ))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
 
         yield {
             "type": "complete",
@@ -601,6 +625,120 @@ class ChatService:
             "warning": llm_error
         }
 
+    async def _post_turn_work(
+        self,
+        user_id: str,
+        conversation_id: str,
+        turn_number: int,
+        content: str,
+        full_response: str,
+        active_memory_ids: List[str],
+        memories: List[Any],
+        history: List[Any]
+    ):
+        """
+        Access statistics, memory extraction and storage for a finished turn.
+        Runs as a background task once the reply is complete; failures are
+        logged and never reach the client.
+        """
+        try:
+            # Update memory access statistics for the memories that were used
+            if active_memory_ids:
+                await self.memory_service.refresh_memory_access_bulk(
+                    memory_ids=active_memory_ids,
+                    user_id=user_id,
+                    current_turn=turn_number
+                )
+
+            # Enhanced memory extraction with reliability and fallbacks
+            extraction_decision = self.memory_extractor.should_extract(turn_number, content)
+
+            if extraction_decision["should_extract"]:
+
+                try:
+                    # First extraction attempt
+                    extracted = await self.memory_extractor.enqueue_extraction(
+                        user_id=user_id,
+                        user_message=content,
+                        assistant_response=full_response,
+                        turn_number=turn_number,
+                        conversation_history=[{"role": m.role, "content": m.content} for m in history],
+                        extraction_boost=extraction_decision.get("extraction_boost", 0.0)
+                    )
+
+                    # Backup extraction if nothing was extracted but should have been
+                    if not extracted and extraction_decision.get("priority") in ["critical", "high"]:
+                        backup_extracted = await self._backup_extraction(
+                            user_message=content,
+                            assistant_response=full_response,
+                            turn_number=turn_number,
+                            priority=extraction_decision["priority"]
+                        )
+                        extracted.extend(backup_extracted)
+
+                    if extracted:
+                        extracted = self._dedupe_extracted_memories(extracted)
+                        pending_memories = []
+                        existing_signatures = {
+                            (
+                                self._normalize_memory_text(mem.memory_type),
+                                self._normalize_memory_text(mem.value)
+                            )
+                            for mem in memories
+                        }
+
+                        for mem in extracted:
+                            try:
+                                # Apply importance boost based on extraction priority
+                                if extraction_decision.get("extraction_boost"):
+                                    mem["importance"] = min(1.0, mem.get('importance', 0.5) + extraction_decision["extraction_boost"])
+
+                                signature = (
+                                    self._normalize_memory_text(mem.get("type", "")),
+                                    self._normalize_memory_text(mem.get("value", "")),
+                                )
+                                if signature in existing_signatures:
+                                    continue
+
+
+                                pending_memories.append({
+                                    "memory_type": mem['type'],
+                                    "key": mem['key'],
+                                    "value": mem['value'],
+                                    "conversation_id": conversation_id,
+                                    "turn_number": turn_number,
+                                    "confidence": mem.get('confidence', 0.5),
+                                    "importance": mem.get('importance', 0.5),
+                                    "context": f"From conversation turn {turn_number} (priority: {extraction_decision['priority']})"
+                                })
+                                existing_signatures.add(signature)
+
+                            except Exception as mem_error:
+                                # Malformed extraction, continue with others
+                                logger.warning("Skipping extracted memory: %s", mem_error)
+
+                        # Store the whole turn's memories in one batch
+                        if pending_memories:
+                            try:
+                                await self.memory_service.create_memories_bulk(user_id, pending_memories)
+                            except Exception as mem_error:
+                                logger.warning("Failed to store extracted memories: %s", mem_error)
+                    else:
+                        pass  # No memories extracted
+
+                except Exception as e:
+                    logger.warning("Memory extraction failed on turn %s: %s", turn_number, e)
+                    # Try emergency fallback extraction for critical cases
+                    if extraction_decision.get("priority") == "critical":
+                        await self._emergency_memory_extraction(
+                            user_id=user_id,
+                            user_message=content,
+                            conversation_id=conversation_id,
+                            turn_number=turn_number
+                        )
+        except Exception:
+            logger.exception("Post-turn work failed on turn %s", turn_number)
+
     async def _backup_extraction(
         self,
         user_message: str,
@@ -690,37 +828,28 @@ Return as JSON array. If nothing found, return []."""
         Emergency extraction for critical cases where main extraction failed completely.
         Uses keyword-based detection to ensure important information is not lost.
         """
-        
-        emergency_patterns = {
-            "name": [r"my name is (\w+)", r"call me (\w+)", r"i'm (\w+)", r"i am (\w+)"],
-            "location": [r"i live in ([\w\s]+)", r"from ([\w\s]+)", r"work at ([\w\s]+)"],
-            "preference": [r"i like ([\w\s]+)", r"i love ([\w\s]+)", r"favorite ([\w\s]+)"],
-            "age": [r"(\d+) years old", r"age (\d+)", r"(\d+)\s?years? old"]
-        }
-        
-        import re
         found_memories = []
         
-        for memory_type, patterns in emergency_patterns.items():
-            for pattern in patterns:
-                matches = re.findall(pattern, user_message.lower())
-                if matches:
-                    for match in matches:
-                        try:
-                            await self.memory_service.create_memory(
-                                user_id=user_id,
-                                memory_type="fact" if memory_type != "preference" else "preference",
-                                key=f"emergency_{memory_type}",
-                                value=match.strip(),
-                                conversation_id=conversation_id,
-                                turn_number=turn_number,
-                                confidence=0.6,  # Lower confidence for emergency extraction
-                                importance=0.8,  # But high importance to preserve it
-                                context=f"Emergency extraction turn {turn_number} - failed main extraction"
-                            )
-                            found_memories.append(f"{memory_type}: {match}")
-                        except Exception as e:
-                            pass  # Emergency memory creation failed
+        for memory_type, pattern in _EMERGENCY_PATTERNS:
+            # One scan per type; only the matching alternative's group is set
+            matches = [m.group(m.lastindex).lower() for m in pattern.finditer(user_message)]
+            if matches:
+                for match in matches:
+                    try:
+                        await self.memory_service.create_memory(
+                            user_id=user_id,
+                            memory_type="fact" if memory_type != "preference" else "preference",
+                            key=f"emergency_{memory_type}",
+                            value=match.strip(),
+                            conversation_id=conversation_id,
+                            turn_number=turn_number,
+                            confidence=0.6,  # Lower confidence for emergency extraction
+                            importance=0.8,  # But high importance to preserve it
+                            context=f"Emergency extraction turn {turn_number} - failed main extraction"
+                        )
+                        found_memories.append(f"{memory_type}: {match}")
+                    except Exception as e:
+                        pass  # Emergency memory creation failed
         
         if found_memories:
             pass  # Found memories but no action needed
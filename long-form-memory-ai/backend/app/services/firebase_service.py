@@ -19,14 +19,22 @@ from fastapi import HTTPException
 from datetime import datetime
 from app.models.user import User
 from app.config import settings
+from app.services.auth_service import get_redis, invalidate_cached_user
+import asyncio
+import hashlib
 import json
 import os
+import time
+
+# In-process cache of verified ID tokens: sha256(token) -> (expires_at, claims)
+_TOKEN_CACHE_MAX = 1024
 
 class FirebaseService:
     """Service for Firebase authentication operations."""
     
     def __init__(self):
         self._app = None
+        self._token_cache: Dict[str, tuple] = {}
         self._initialize_firebase()
     
     def _initialize_firebase(self):
@@ -97,10 +105,14 @@ class FirebaseService:
                 detail="Firebase authentication not available - check configuration"
             )
         
+        token_hash = hashlib.sha256(id_token.encode()).hexdigest()
+        cached = await self._get_cached_claims(token_hash)
+        if cached is not None:
+            return cached
+
         try:
-            # Verify the ID token
-            decoded_token = auth.verify_id_token(id_token)
-            return decoded_token
+            # Verify the ID token (JWKS fetch + RS256 check) off the event loop
+            decoded_token = await asyncio.to_thread(auth.verify_id_token, id_token)
         except auth.ExpiredIdTokenError:
             raise HTTPException(
                 status_code=401,
@@ -117,6 +129,60 @@ class FirebaseService:
                 status_code=401,
                 detail="Token verification failed"
             )
+
+        await self._cache_claims(token_hash, decoded_token)
+        return decoded_token
+
+    def _claims_ttl(self, claims: Dict[str, Any]) -> int:
+        """Seconds a verified token may be reused: never past its own expiry."""
+        remaining = int(claims.get("exp", 0) - time.time())
+        return min(remaining, settings.FIREBASE_TOKEN_CACHE_TTL_SECONDS)
+
+    async def _get_cached_claims(self, token_hash: str) -> Optional[Dict[str, Any]]:
+        """Look up previously verified claims locally, then in Redis."""
+        entry = self._token_cache.get(token_hash)
+        if entry:
+            expires_at, claims = entry
+            if expires_at > time.monotonic():
+                return claims
+            self._token_cache.pop(token_hash, None)
+
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            cached = await client.get(f"fbid:{token_hash}")
+        except Exception:
+            return None
+        if not cached:
+            return None
+
+        claims = json.loads(cached)
+        ttl = self._claims_ttl(claims)
+        if ttl <= 0:
+            return None
+        self._remember_claims(token_hash, claims, ttl)
+        return claims
+
+    async def _cache_claims(self, token_hash: str, claims: Dict[str, Any]) -> None:
+        ttl = self._claims_ttl(claims)
+        if ttl <= 0:
+            return
+        self._remember_claims(token_hash, claims, ttl)
+
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            await client.setex(f"fbid:{token_hash}", ttl, json.dumps(claims))
+        except Exception:
+            pass
+
+    def _remember_claims(self, token_hash: str, claims: Dict[str, Any], ttl: int) -> None:
+        if len(self._token_cache) >= _TOKEN_CACHE_MAX:
+            # Evict the oldest insertion
+            self._token_cache.pop(next(iter(self._token_cache)))
+        self._token_cache[token_hash] = (time.monotonic() + ttl, claims)
     
     async def create_or_update_user(self, firebase_user: Dict[str, Any], user_info: Dict[str, Any]) -> User:
         """Create or update user from Firebase authentication."""
@@ -146,14 +212,13 @@ class FirebaseService:
             existing_user.auth_provider = 'google'
             existing_user.last_login = datetime.utcnow()
             
-            # Update profile if provided
-            if user_info.get('displayName'):
-                existing_user.username = user_info['displayName']
+            # Update profile if provided; the username is only set when the account is created
             if user_info.get('photoURL'):
                 existing_user.avatar_url = user_info['photoURL']
             
             existing_user.email_verified = firebase_user.get('email_verified', False)
             await existing_user.save()
+            await invalidate_cached_user(str(existing_user.id))
             
             print(f"Updated existing user: {email}")
             return existing_user
@@ -167,14 +232,13 @@ class FirebaseService:
             existing_email_user.auth_provider = 'google'
             existing_email_user.last_login = datetime.utcnow()
             
-            # Update profile if provided
-            if user_info.get('displayName'):
-                existing_email_user.username = user_info['displayName']
+            # Update profile if provided; keep the username the account registered with
             if user_info.get('photoURL'):
                 existing_email_user.avatar_url = user_info['photoURL']
             
             existing_email_user.email_verified = firebase_user.get('email_verified', False)
             await existing_email_user.save()
+            await invalidate_cached_user(str(existing_email_user.id))
             
             print(f"Linked Firebase to existing user: {email}")
             return existing_email_user
@@ -1,6 +1,6 @@
 import httpx
-import json
-from typing import AsyncGenerator, List, Dict
+import orjson
+from typing import AsyncGenerator, List, Dict, Any
 from app.config import settings
 
 
@@ -17,15 +17,15 @@ class LLMService:
             "X-Title": "LongFormMemoryAI",
         }
 
-    async def generate_response(
+    def _build_payload(
         self,
         messages: List[Dict[str, str]],
-        stream: bool = False,
+        stream: bool,
         max_tokens: int = None,
         temperature: float = None,
-        top_p: float = None
-    ) -> AsyncGenerator[Dict[str, str], None]:
-
+        top_p: float = None,
+        response_format: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
         payload = {
             "model": self.model,
             "messages": messages,
@@ -38,7 +38,53 @@ class LLMService:
             payload["temperature"] = temperature
         if top_p is not None:
             payload["top_p"] = top_p
+        if response_format is not None:
+            payload["response_format"] = response_format
+        return payload
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = None,
+        temperature: float = None,
+        top_p: float = None,
+        response_format: Dict[str, Any] = None
+    ) -> str:
+        """Non-streaming completion: return the reply text directly. Raises on failure."""
+        payload = self._build_payload(
+            messages, False, max_tokens, temperature, top_p, response_format
+        )
+
+        async with httpx.AsyncClient(timeout=60) as client:
+            response = await client.post(
+                f"{self.base_url}/chat/completions",
+                headers=self.headers,
+                content=orjson.dumps(payload),
+            )
+
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+
+        text = (
+            result.get("choices", [{}])[0]
+            .get("message", {})
+            .get("content")
+        )
+        return text or ""
+
+    async def generate_response(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool = False,
+        max_tokens: int = None,
+        temperature: float = None,
+        top_p: float = None,
+        response_format: Dict[str, Any] = None
+    ) -> AsyncGenerator[Dict[str, str], None]:
 
+        payload = self._build_payload(
+            messages, stream, max_tokens, temperature, top_p, response_format
+        )
 
         try:
             async with httpx.AsyncClient(timeout=60) as client:
@@ -49,7 +95,7 @@ class LLMService:
                         "POST",
                         f"{self.base_url}/chat/completions",
                         headers=self.headers,
-                        json=payload,
+                        content=orjson.dumps(payload),
                     ) as response:
 
                         response.raise_for_status()
@@ -68,8 +114,8 @@ class LLMService:
                             data = line.replace("data:", "").strip()
 
                             try:
-                                chunk = json.loads(data)
-                            except Exception as e:
+                                chunk = orjson.loads(data)
+                            except orjson.JSONDecodeError:
                                 continue
 
                             delta = (
@@ -89,11 +135,11 @@ class LLMService:
                     response = await client.post(
                         f"{self.base_url}/chat/completions",
                         headers=self.headers,
-                        json=payload,
+                        content=orjson.dumps(payload),
                     )
 
                     response.raise_for_status()
-                    result = response.json()
+                    result = orjson.loads(response.content)
 
                     text = (
                         result.get("choices", [{}])[0]
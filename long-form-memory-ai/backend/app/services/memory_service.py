@@ -1,8 +1,46 @@
 
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+import logging
 
-from app.models.memory import Memory
+import numpy as np
+from bson import ObjectId
+
+from pydantic import ValidationError
+
+from app.models.memory import Memory, format_memory_line
+
+logger = logging.getLogger(__name__)
+
+
+def _rank_by_recency(memories: List[Memory], limit: int) -> List[Memory]:
+    """
+    Hybrid recency ranking, vectorized over all memories at once:
+    a time score (steep for the last 6 hours, then a gradual decay)
+    plus a turn score that favors early conversation turns.
+    """
+    if not memories or limit <= 0:
+        return memories[:max(limit, 0)]
+
+    now = np.datetime64(datetime.utcnow(), "us")
+    created = np.array([mem.created_at for mem in memories], dtype="datetime64[us]")
+    hours_old = (now - created) / np.timedelta64(1, "h")
+    turns = np.fromiter((mem.source_turn for mem in memories), dtype=np.float64, count=len(memories))
+
+    time_score = np.where(
+        hours_old <= 6,
+        1000 - hours_old * 100,
+        400 - np.minimum(hours_old * 2, 400)
+    )
+    scores = time_score + np.maximum(0, 100 - turns)
+
+    # Only the top `limit` need ordering; partition first on large sets
+    if limit < len(scores):
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        order = top[np.argsort(-scores[top], kind="stable")]
+    else:
+        order = np.argsort(-scores, kind="stable")
+    return [memories[i] for i in order]
 
 
 class MemoryService:
@@ -50,6 +88,7 @@ class MemoryService:
             memory_type=memory_type,
             key=key,
             value=value,
+            formatted_line=format_memory_line(key, value),
             context=context,
             source_conversation_id=conversation_id,
             source_turn=turn_number,
@@ -65,6 +104,56 @@ class MemoryService:
         
         return memory
 
+    async def create_memories_bulk(
+        self,
+        user_id: str,
+        docs: List[Dict[str, Any]]
+    ) -> List[Memory]:
+        """
+        Create several memories in two round-trips: one update_many that
+        deactivates the active memories they supersede, and one insert_many.
+        Each doc takes create_memory's arguments (memory_type, key, value,
+        conversation_id, turn_number, confidence, importance, context).
+        Within a batch the last doc for a (memory_type, key) wins, as with
+        sequential create_memory calls. A doc that fails validation is logged
+        and skipped without dropping the rest of the batch.
+        """
+        now = datetime.utcnow()
+        latest: Dict[tuple, Memory] = {}
+        for doc in docs:
+            try:
+                latest[(doc["memory_type"], doc["key"])] = Memory(
+                    user_id=user_id,
+                    memory_type=doc["memory_type"],
+                    key=doc["key"],
+                    value=doc["value"],
+                    formatted_line=format_memory_line(doc["key"], doc["value"]),
+                    context=doc.get("context", ""),
+                    source_conversation_id=doc.get("conversation_id"),
+                    source_turn=doc["turn_number"],
+                    confidence=doc.get("confidence", 0.5),
+                    importance_score=doc.get("importance", 0.5),
+                    is_active=True,
+                    created_at=now
+                )
+            except (KeyError, ValidationError) as e:
+                logger.warning("Skipping invalid memory %r: %s", doc.get("key"), e)
+        if not latest:
+            return []
+
+        await Memory.find({
+            "user_id": user_id,
+            "is_active": True,
+            "$or": [{"memory_type": t, "key": k} for t, k in latest],
+        }).update({"$set": {"is_active": False, "updated_at": now}})
+
+        memories = list(latest.values())
+        result = await Memory.insert_many(memories)
+        for memory, inserted_id in zip(memories, result.inserted_ids):
+            memory.id = inserted_id
+
+        return memories
+
     async def get_user_memories(
         self,
         user_id: str,
@@ -100,26 +189,8 @@ class MemoryService:
         elif sort_by == "recency":
             # Hybrid sort: prioritize by creation time, then by turn number
             # This ensures memories from recent conversations are included
-            memories = await query.to_list()  # Get all, then sort in Python for hybrid logic
-            
-            # Sort with hybrid scoring
-            def hybrid_sort_key(mem):
-                now = datetime.utcnow()
-                hours_old = (now - mem.created_at).total_seconds() / 3600
-                
-                # Recent memories (last 6 hours) get highest priority
-                if hours_old <= 6:
-                    time_score = 1000 - (hours_old * 100)  # Higher score for newer
-                else:
-                    time_score = 400 - min(hours_old * 2, 400)  # Gradual decay
-                
-                # Add turn-based score (lower penalty for older turns)
-                turn_score = max(0, 100 - mem.source_turn)
-                
-                return time_score + turn_score
-            
-            memories.sort(key=hybrid_sort_key, reverse=True)
-            memories = memories[:limit]
+            memories = await query.to_list()  # Get all, then rank with NumPy for hybrid logic
+            memories = _rank_by_recency(memories, limit)
         elif sort_by == "importance":
             memories = await query.sort("-importance_score").limit(limit).to_list()
         else:
@@ -227,6 +298,28 @@ class MemoryService:
         
         return True
 
+    async def refresh_memory_access_bulk(
+        self,
+        memory_ids: List[str],
+        user_id: str,
+        current_turn: int
+    ) -> int:
+        """
+        Update access statistics for every memory used in a turn with one write.
+        updated_at is left alone: a read is not an edit, and the formatted
+        memory context cache keys on it.
+        """
+
+        if not memory_ids:
+            return 0
+
+        result = await Memory.get_motor_collection().update_many(
+            {"_id": {"$in": [ObjectId(memory_id) for memory_id in memory_ids]}, "user_id": user_id},
+            {"$set": {"last_accessed_turn": current_turn}, "$inc": {"access_count": 1}}
+        )
+
+        return result.modified_count
+
     async def update_memory(
         self,
         memory_id: str,
@@ -251,6 +344,8 @@ class MemoryService:
         for field, value in updates.items():
             if field in allowed_fields:
                 setattr(memory, field, value)
+        if "value" in updates:
+            memory.formatted_line = format_memory_line(memory.key, memory.value)
 
         memory.updated_at = datetime.utcnow()
         await memory.save()
@@ -284,21 +379,17 @@ class MemoryService:
         Returns the count of memories deleted.
         """
         
-        memories = await Memory.find(
-            Memory.user_id == user_id,
-            Memory.source_conversation_id == conversation_id,
-            Memory.is_active == True
-        ).to_list()
-        
-        count = 0
-        for mem in memories:
-            mem.is_active = False
-            mem.updated_at = datetime.utcnow()
-            await mem.save()
-            count += 1
-            print(f"   Deactivated memory: [{mem.memory_type}] {mem.key}: {mem.value}")
+        # One update_many instead of a save() per memory
+        result = await Memory.get_motor_collection().update_many(
+            {
+                "user_id": user_id,
+                "source_conversation_id": conversation_id,
+                "is_active": True
+            },
+            {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
+        )
         
-        return count
+        return result.modified_count
 
     async def get_memory_stats(
         self,
@@ -324,23 +415,4 @@ class MemoryService:
             if mem.importance_score >= 0.8:
                 stats["high_importance_memories"] += 1
 
-        return stats
-
-    async def refresh_memory_access(
-        self,
-        memory_id: str,
-        user_id: str,
-        current_turn: int
-    ) -> bool:
-        """Update last accessed metadata for a memory."""
-
-        memory = await Memory.get(memory_id)
-        if not memory or memory.user_id != user_id:
-            return False
-
-        memory.access_count += 1
-        memory.last_accessed_turn = current_turn
-        memory.updated_at = datetime.utcnow()
-        await memory.save()
-
-        return True
\ No newline at end of file
+        return stats
\ No newline at end of file